@@ -29,6 +29,62 @@ ALLOWED_HOSTS = []
 
 LOGIN_URL = 'login'
 AUTH_USER_MODEL = 'hospital.User'
+
+# How long (seconds) a booking/cancel/prescription POST can be replayed by its idempotency key.
+# Keys are stored in the database (IdempotencyRecord), so duplicates are caught across workers
+IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Token-bucket limits for booking POSTs, as (requests, seconds) per user, per doctor and overall.
+# Use 'hospital.ratelimit.FileBackend' (with 'FILE_PATH') to share buckets between worker processes.
+RATE_LIMITS = {
+    'BACKEND': 'hospital.ratelimit.InMemoryBackend',
+    'booking': {
+        'user': (5, 60),
+        'doctor': (60, 60),
+        'global': (300, 60),
+    },
+}
+
+# Event bus behind the doctor dashboard's live queue stream.
+# Use 'hospital.events.FileEventBus' (with 'DIRECTORY') when running several worker processes.
+EVENT_BUS = {
+    'BACKEND': 'hospital.events.InProcessEventBus',
+}
+
+# Ranges of at least MIN_DAYS days are answered from memory-mapped columnar snapshots
+# kept in DIRECTORY (see hospital/snapshots.py) instead of GROUP BY queries.
+# A request refreshes a snapshot older than REFRESH_INTERVAL seconds
+ANALYTICS_SNAPSHOT = {
+    'DIRECTORY': BASE_DIR / 'var' / 'snapshots',
+    'MIN_DAYS': 180,
+    'REFRESH_INTERVAL': 5 * 60,
+}
+
+# Rendered QR code PNGs: an in-process LRU of MAX_BYTES, backed by DIRECTORY when set.
+# The directory grows without bound and holds patient details, so it is opt-in
+QR_CODE_CACHE = {
+    'MAX_BYTES': 8 * 1024 * 1024,
+    'DIRECTORY': None,
+}
+
+# Appointment token PDFs are rendered once per token content into DIRECTORY;
+# RENDER_ON_SAVE renders them on a background thread right after booking.
+# Day-sheet batches encode QR codes on a pool of BATCH_WORKERS processes (None: one per CPU),
+# started once per web worker from a fork server.
+# `manage.py prune_token_pdfs` (run from cron) removes files older than MAX_AGE_DAYS
+TOKEN_PDF = {
+    'DIRECTORY': BASE_DIR / 'var' / 'tokens',
+    'RENDER_ON_SAVE': True,
+    'BATCH_WORKERS': None,
+    'MAX_AGE_DAYS': 7,
+}
+
+# Seconds a worker may serve its in-memory doctor directory before rebuilding it.
+# Edits reach other workers immediately only with a shared CACHES backend.
+DOCTOR_DIRECTORY_TTL = 60
+
+# Renumber the remaining scheduled tokens of a doctor's day when an appointment is cancelled
+COMPACT_QUEUE_ON_CANCEL = False
 # Application definition
 
 INSTALLED_APPS = [
@@ -64,6 +120,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'hospital.context_processors.idempotency_key',
             ],
         },
     },
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.safestring import mark_safe
 
-from hospital.models import Doctor, Patient, User, Appointment, Prescription, LabReport
+from hospital.models import Doctor, Patient, User, Appointment, Prescription, LabReport, WaitlistEntry
 
 
 @admin.register(User)
@@ -23,7 +23,7 @@ class CustomUserAdmin(UserAdmin):
     def profile_image_preview(self, obj):
         if obj.profile_image:
             return mark_safe(
-                f'<img src="{obj.profile_image.url}" style="width: 30px; height: 30px; object-fit: cover; border-radius: 50%;" />')
+                f'<img src="{obj.profile_image_thumbnail_url}" style="width: 30px; height: 30px; object-fit: cover; border-radius: 50%;" />')
         return "No Image"
 
     profile_image_preview.short_description = 'Profile Image'
@@ -34,7 +34,7 @@ class CustomUserAdmin(UserAdmin):
         # Make the profile image field show a preview in change form
         if obj and obj.profile_image:
             form.base_fields[
-                'profile_image'].help_text = f'<img src="{obj.profile_image.url}" style="max-height: 200px; max-width: 200px; border-radius: 5px; margin: 10px 0;" />'
+                'profile_image'].help_text = f'<img src="{obj.profile_image_large_url}" style="max-height: 200px; max-width: 200px; border-radius: 5px; margin: 10px 0;" />'
         return form
 
 
@@ -70,6 +70,13 @@ class AppointmentAdmin(admin.ModelAdmin):
     get_doctor_name.short_description = 'Doctor'
 
 
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'doctor', 'appointment_date', 'status', 'created_at')
+    list_filter = ('status', 'appointment_date')
+    search_fields = ('patient__first_name', 'patient__last_name', 'doctor__user__first_name', 'doctor__user__last_name')
+
+
 @admin.register(Prescription)
 class PrescriptionAdmin(admin.ModelAdmin):
     list_display = ('appointment', 'created_at', 'updated_at')
@@ -0,0 +1,398 @@
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, ExtractHour, NullIf, TruncDate, TruncMonth, TruncWeek
+
+from hospital.models import Appointment, DailyAppointmentStats, Doctor, LabReport
+from hospital.snapshots import AppointmentSnapshot, LabReportSnapshot, get_snapshot
+
+# Analytics queries for the admin pages. Appointment counts come from the
+# DailyAppointmentStats rollup; every bucket (day, week, hour) is one GROUP BY with the truncation done
+# by the database, so any date range costs the same number of round trips.
+
+
+def _completed_sum():
+    return Coalesce(Sum('count', filter=Q(status='completed')), 0)
+
+
+def _completion_rate():
+    # Float division in SQL; NullIf keeps empty buckets from dividing by zero
+    return Coalesce(
+        Cast(_completed_sum(), FloatField()) * 100.0 / NullIf(Cast(Sum('count'), FloatField()), 0.0),
+        0.0,
+    )
+
+
+def stats_in_range(start_date, end_date):
+    return DailyAppointmentStats.objects.filter(appointment_date__range=[start_date, end_date])
+
+
+def daily_counts(start_date, end_date):
+    """Per-day totals with a per-status breakdown"""
+    return list(
+        stats_in_range(start_date, end_date).values('appointment_date').annotate(
+            total=Sum('count'),
+            completed=_completed_sum(),
+            scheduled=Coalesce(Sum('count', filter=Q(status='scheduled')), 0),
+            cancelled=Coalesce(Sum('count', filter=Q(status='cancelled')), 0),
+        ).filter(total__gt=0).order_by('appointment_date')
+    )
+
+
+def weekly_counts(start_date, end_date):
+    """Totals per ISO week (Monday start), labelled with the part of the week inside the range"""
+    weeks = stats_in_range(start_date, end_date).annotate(
+        week_start=TruncWeek('appointment_date')
+    ).values('week_start').annotate(
+        total=Sum('count'),
+    ).order_by('week_start')
+
+    trends = []
+    for week in weeks:
+        # TruncWeek gives a datetime on some backends and a date on others
+        week_start = getattr(week['week_start'], 'date', lambda: week['week_start'])()
+        week_end = week_start + timedelta(days=6)
+        trends.append({
+            'week': f"{max(week_start, start_date).strftime('%m/%d')}-{min(week_end, end_date).strftime('%m/%d')}",
+            'week_start': week_start,
+            'total': week['total'],
+        })
+    return trends
+
+
+def peak_hours(start_date, end_date):
+    """Scheduled hours ranked by number of appointments (needs per-appointment times)"""
+    return list(
+        Appointment.objects.filter(
+            appointment_date__range=[start_date, end_date]
+        ).annotate(
+            hour=ExtractHour('estimated_time')
+        ).values('hour').annotate(
+            count=Count('id'),
+        ).order_by('-count', 'hour')
+    )
+
+
+def doctor_stats(start_date, end_date):
+    """Per-doctor totals and completion rate, busiest first"""
+    return list(
+        stats_in_range(start_date, end_date).values(
+            'doctor__user__first_name',
+            'doctor__user__last_name',
+            'doctor__specialization',
+        ).annotate(
+            total=Sum('count'),
+            completed=_completed_sum(),
+            completion_rate=_completion_rate(),
+        ).filter(total__gt=0).order_by('-total')
+    )
+
+
+def status_distribution(start_date, end_date):
+    return list(
+        stats_in_range(start_date, end_date).values('status').annotate(
+            count=Sum('count'),
+        ).filter(count__gt=0).order_by('-count')
+    )
+
+
+def overview(start_date, end_date):
+    """Total appointments and overall completion rate for the range"""
+    return stats_in_range(start_date, end_date).aggregate(
+        total=Coalesce(Sum('count'), 0),
+        completion_rate=_completion_rate(),
+    )
+
+
+def use_snapshot(start_date, end_date):
+    """Long ranges are answered from the columnar snapshots (see hospital/snapshots.py)"""
+    min_days = getattr(settings, 'ANALYTICS_SNAPSHOT', {}).get('MIN_DAYS')
+    return min_days is not None and (end_date - start_date).days >= min_days
+
+
+def _doctor_names(doctor_ids):
+    return {
+        doctor['id']: doctor
+        for doctor in Doctor.objects.filter(id__in=doctor_ids).values(
+            'id', 'user__first_name', 'user__last_name', 'specialization'
+        )
+    }
+
+
+def appointment_analytics(start_date, end_date):
+    """Everything behind the appointment analytics page for one range"""
+    if use_snapshot(start_date, end_date):
+        return _appointment_analytics_from_snapshot(start_date, end_date)
+
+    totals = overview(start_date, end_date)
+    return {
+        'daily_counts': daily_counts(start_date, end_date),
+        'doctor_stats': doctor_stats(start_date, end_date),
+        'status_distribution': status_distribution(start_date, end_date),
+        'weekly_trends': weekly_counts(start_date, end_date),
+        'peak_hours': peak_hours(start_date, end_date),
+        'total_appointments': totals['total'],
+        'completion_rate': totals['completion_rate'],
+    }
+
+
+def _appointment_analytics_from_snapshot(start_date, end_date):
+    first_day, last_day = start_date.toordinal(), end_date.toordinal()
+    snapshot = get_snapshot(AppointmentSnapshot)
+    with snapshot.open() as columns:
+        statuses = columns['dictionaries'].get('status', [])
+        specializations = columns['dictionaries'].get('specialization', [])
+        # Only the rows inside the range are read; the rest of the loop works on the distinct keys
+        positions = snapshot.positions_between(columns, first_day, last_day)
+        grouped = Counter(snapshot.rows_at(
+            columns, ('day', 'doctor', 'status', 'hour', 'specialization'), positions
+        ))
+
+    days = defaultdict(Counter)
+    doctors = defaultdict(Counter)
+    doctor_specialization = {}
+    by_status, by_hour = Counter(), Counter()
+    for (day, doctor, status, hour, specialization), count in grouped.items():
+        status = statuses[status]
+        days[day][status] += count
+        doctors[doctor][status] += count
+        doctor_specialization[doctor] = specializations[specialization]
+        by_status[status] += count
+        if hour >= 0:
+            by_hour[hour] += count
+
+    daily = []
+    weeks = Counter()
+    for day in sorted(days):
+        counts = days[day]
+        appointment_date = date.fromordinal(day)
+        daily.append({
+            'appointment_date': appointment_date,
+            'total': sum(counts.values()),
+            'completed': counts['completed'],
+            'scheduled': counts['scheduled'],
+            'cancelled': counts['cancelled'],
+        })
+        weeks[appointment_date - timedelta(days=appointment_date.weekday())] += daily[-1]['total']
+
+    names = _doctor_names(doctors)
+    per_doctor = []
+    for doctor, counts in doctors.items():
+        total = sum(counts.values())
+        per_doctor.append({
+            'doctor__user__first_name': names.get(doctor, {}).get('user__first_name', ''),
+            'doctor__user__last_name': names.get(doctor, {}).get('user__last_name', ''),
+            'doctor__specialization': doctor_specialization[doctor],
+            'total': total,
+            'completed': counts['completed'],
+            'completion_rate': counts['completed'] * 100.0 / total,
+        })
+    per_doctor.sort(key=lambda row: -row['total'])
+
+    total = sum(by_status.values())
+    return {
+        'daily_counts': daily,
+        'doctor_stats': per_doctor,
+        'status_distribution': [{'status': status, 'count': count} for status, count in by_status.most_common()],
+        'weekly_trends': [
+            {
+                'week': f"{max(week_start, start_date).strftime('%m/%d')}-{min(week_start + timedelta(days=6), end_date).strftime('%m/%d')}",
+                'week_start': week_start,
+                'total': weeks[week_start],
+            }
+            for week_start in sorted(weeks)
+        ],
+        'peak_hours': [
+            {'hour': hour, 'count': count}
+            for hour, count in sorted(by_hour.items(), key=lambda item: (-item[1], item[0]))
+        ],
+        'total_appointments': total,
+        'completion_rate': by_status['completed'] * 100.0 / total if total else 0.0,
+    }
+
+
+# Lab reports --------------------------------------------------------------
+
+LAB_STATS_VERSION_KEY = 'lab_report_stats:version'
+
+
+def _lab_stats_version():
+    version = cache.get(LAB_STATS_VERSION_KEY)
+    if version is None:
+        cache.add(LAB_STATS_VERSION_KEY, 1, None)
+        version = cache.get(LAB_STATS_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_lab_report_statistics():
+    """Drop every cached range at once by moving to a new version"""
+    try:
+        cache.incr(LAB_STATS_VERSION_KEY)
+    except ValueError:
+        cache.add(LAB_STATS_VERSION_KEY, 1, None)
+
+
+def _as_date(value):
+    # Trunc* gives datetimes on some backends and dates on others
+    return value.date() if hasattr(value, 'date') else value
+
+
+def _months_between(start_date, end_date):
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def _lab_report_statistics_from_snapshot(start_date, end_date):
+    first_day, last_day = start_date.toordinal(), end_date.toordinal()
+    snapshot = get_snapshot(LabReportSnapshot)
+    with snapshot.open() as columns:
+        report_types = columns['dictionaries'].get('report_type', [])
+        test_names = columns['dictionaries'].get('test_name', [])
+        positions = snapshot.positions_between(columns, first_day, last_day)
+        grouped = Counter(snapshot.rows_at(columns, ('day', 'doctor', 'report_type', 'test_name'), positions))
+        patients = set(snapshot.rows_at(columns, ('doctor', 'patient'), positions))
+
+    by_day, by_month, by_doctor, by_type, by_test = Counter(), Counter(), Counter(), Counter(), Counter()
+    for (day, doctor, report_type, test_name), count in grouped.items():
+        upload_date = date.fromordinal(day)
+        by_day[upload_date] += count
+        by_month[upload_date.replace(day=1)] += count
+        by_doctor[doctor] += count
+        by_type[report_types[report_type]] += count
+        by_test[test_names[test_name]] += count
+
+    patients_by_doctor = Counter(doctor for doctor, patient in patients)
+    names = _doctor_names(by_doctor)
+    return {
+        'total_reports': sum(by_day.values()),
+        'unique_patients': len({patient for doctor, patient in patients}),
+        'unique_doctors': len(by_doctor),
+        'type_distribution': [{'report_type': name, 'count': count} for name, count in by_type.most_common()],
+        'daily_uploads': [{'upload_date': day, 'count': by_day[day]} for day in sorted(by_day)],
+        'monthly_trend': [
+            {'year': month.year, 'month': month.month, 'count': by_month.get(month, 0)}
+            for month in _months_between(start_date, end_date)
+        ],
+        'doctor_stats': [
+            {
+                'doctor__user__first_name': names.get(doctor, {}).get('user__first_name', ''),
+                'doctor__user__last_name': names.get(doctor, {}).get('user__last_name', ''),
+                'doctor__specialization': names.get(doctor, {}).get('specialization', ''),
+                'total_reports': count,
+                'unique_patients': patients_by_doctor[doctor],
+            }
+            for doctor, count in by_doctor.most_common()
+        ],
+        'common_tests': [{'test_name': name, 'count': count} for name, count in by_test.most_common(10)],
+    }
+
+
+def _compute_lab_report_statistics(start_date, end_date):
+    if use_snapshot(start_date, end_date):
+        return _lab_report_statistics_from_snapshot(start_date, end_date)
+
+    reports = LabReport.objects.filter(uploaded_at__date__range=[start_date, end_date])
+
+    totals = reports.aggregate(
+        total_reports=Count('id'),
+        unique_patients=Count('appointment__patient', distinct=True),
+        unique_doctors=Count('doctor', distinct=True),
+    )
+
+    type_distribution = list(
+        reports.values('report_type').annotate(count=Count('id')).order_by('-count')
+    )
+
+    daily_uploads = [
+        {'upload_date': _as_date(row['upload_date']), 'count': row['count']}
+        for row in reports.annotate(upload_date=TruncDate('uploaded_at'))
+        .values('upload_date').annotate(count=Count('id')).order_by('upload_date')
+    ]
+
+    by_month = {
+        _as_date(row['month']): row['count']
+        for row in reports.annotate(month=TruncMonth('uploaded_at'))
+        .values('month').annotate(count=Count('id'))
+    }
+    monthly_trend = [
+        {'year': month.year, 'month': month.month, 'count': by_month.get(month, 0)}
+        for month in _months_between(start_date, end_date)
+    ]
+
+    doctor_stats = list(
+        reports.values(
+            'doctor__user__first_name',
+            'doctor__user__last_name',
+            'doctor__specialization'
+        ).annotate(
+            total_reports=Count('id'),
+            unique_patients=Count('appointment__patient', distinct=True)
+        ).order_by('-total_reports')
+    )
+
+    common_tests = list(
+        reports.values('test_name').annotate(count=Count('id')).order_by('-count')[:10]
+    )
+
+    return {
+        **totals,
+        'type_distribution': type_distribution,
+        'daily_uploads': daily_uploads,
+        'monthly_trend': monthly_trend,
+        'doctor_stats': doctor_stats,
+        'common_tests': common_tests,
+    }
+
+
+def lab_report_statistics(start_date, end_date):
+    """Bucketed lab report counts for a date range, cached until a report is added or removed"""
+    key = f"lab_report_stats:{_lab_stats_version()}:{start_date.isoformat()}:{end_date.isoformat()}"
+    stats = cache.get(key)
+    if stats is None:
+        stats = _compute_lab_report_statistics(start_date, end_date)
+        cache.set(key, stats, getattr(settings, 'LAB_REPORT_STATS_TTL', 60 * 60))
+    return stats
+
+
+def _year_earlier(date):
+    try:
+        return date.replace(year=date.year - 1)
+    except ValueError:  # 29 February
+        return date.replace(year=date.year - 1, day=28)
+
+
+def _change(current, previous):
+    return {
+        'current': current,
+        'previous': previous,
+        'change': current - previous,
+        'percent': (current - previous) * 100.0 / previous if previous else None,
+    }
+
+
+def lab_report_year_over_year(start_date, end_date, current=None):
+    """Compare a range with the same range one year earlier"""
+    current = current or lab_report_statistics(start_date, end_date)
+    previous_start, previous_end = _year_earlier(start_date), _year_earlier(end_date)
+    previous = lab_report_statistics(previous_start, previous_end)
+
+    previous_types = {row['report_type']: row['count'] for row in previous['type_distribution']}
+    current_types = {row['report_type']: row['count'] for row in current['type_distribution']}
+    return {
+        'start_date': previous_start,
+        'end_date': previous_end,
+        'total_reports': _change(current['total_reports'], previous['total_reports']),
+        'unique_patients': _change(current['unique_patients'], previous['unique_patients']),
+        'report_types': sorted(
+            (
+                {'report_type': report_type, **_change(current_types.get(report_type, 0), previous_types.get(report_type, 0))}
+                for report_type in current_types.keys() | previous_types.keys()
+            ),
+            key=lambda row: -row['current'],
+        ),
+    }
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from hospital.models import DailyQueue
+
+AVAILABILITY_WINDOW_DAYS = 30
+AVAILABILITY_CACHE_TIMEOUT = 60 * 60
+
+
+def _version_key(doctor_id):
+    return f"doctor_availability_version:{doctor_id}"
+
+
+def _version(doctor_id):
+    key = _version_key(doctor_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _cache_key(doctor_id, start_date):
+    # Versioned per doctor, so one bump drops the calendars cached for every start date
+    return f"doctor_availability:{doctor_id}:{_version(doctor_id)}:{start_date.isoformat()}"
+
+
+def get_doctor_availability(doctor, start_date=None, days=AVAILABILITY_WINDOW_DAYS):
+    """Day-by-day booking availability for a doctor, cached until the doctor or one of their bookings changes"""
+    start_date = start_date or timezone.now().date()
+    key = _cache_key(doctor.id, start_date)
+
+    availability = cache.get(key)
+    if availability is None:
+        availability = _build_availability(doctor, start_date, days)
+        cache.set(key, availability, AVAILABILITY_CACHE_TIMEOUT)
+    return availability
+
+
+def _bookings_key(day):
+    return f"doctor_bookings:{day.isoformat()}"
+
+
+def get_booked_counts(day=None):
+    """{doctor id: appointments booked or seen} for one day, across every doctor"""
+    day = day or timezone.now().date()
+    key = _bookings_key(day)
+
+    booked = cache.get(key)
+    if booked is None:
+        booked = {
+            doctor_id: scheduled + completed
+            for doctor_id, scheduled, completed in DailyQueue.objects.filter(
+                appointment_date=day
+            ).values_list('doctor_id', 'scheduled_count', 'completed_count')
+        }
+        cache.set(key, booked, AVAILABILITY_CACHE_TIMEOUT)
+    return booked
+
+
+def invalidate_doctor_availability(doctor_id, appointment_date=None):
+    """Drop every cached calendar of the doctor, and the booking counts of the day that changed"""
+    key = _version_key(doctor_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    if appointment_date is not None:
+        cache.delete(_bookings_key(appointment_date))
+
+
+def _build_availability(doctor, start_date, days):
+    end_date = start_date + timedelta(days=days)
+
+    # One query for the whole window: DailyQueue already holds per-day counts
+    queues = {
+        queue['appointment_date']: queue
+        for queue in DailyQueue.objects.filter(
+            doctor=doctor,
+            appointment_date__range=[start_date, end_date]
+        ).values('appointment_date', 'last_token', 'scheduled_count', 'completed_count')
+    }
+    calendar = []
+    for offset in range(days + 1):
+        day = start_date + timedelta(days=offset)
+        queue = queues.get(day, {'last_token': 0, 'scheduled_count': 0, 'completed_count': 0})
+        works = doctor.works_on(day)
+        remaining = max(doctor.max_appointments - queue['scheduled_count'] - queue['completed_count'], 0) if works else 0
+        next_token = queue['last_token'] + 1 if remaining else None
+
+        calendar.append({
+            'date': day.isoformat(),
+            'weekday': day.strftime('%A'),
+            'available': works,
+            'remaining': remaining,
+            'next_token': next_token,
+            'next_estimated_time': (
+                doctor.estimated_time_for_token(day, next_token).strftime('%H:%M') if next_token else None
+            ),
+        })
+
+    return {
+        'doctor_id': doctor.id,
+        'max_appointments': doctor.max_appointments,
+        'days': calendar,
+    }
@@ -0,0 +1,10 @@
+import uuid
+
+
+def _new_key():
+    return uuid.uuid4().hex
+
+
+def idempotency_key(request):
+    """Idempotency key for state-changing forms; templates call it, so every form gets its own key"""
+    return {'idempotency_key': _new_key}
@@ -0,0 +1,135 @@
+import bisect
+import re
+import threading
+import time
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from hospital.models import Doctor
+
+# In-memory doctor directory for the public listing and the type-ahead endpoint.
+# Each process keeps one DoctorDirectory built from a single query. It is rebuilt
+# when the version stored in the cache moves on (the Doctor and User receivers in
+# hospital/signals.py bump it after a commit) and in any case once it is older
+# than DOCTOR_DIRECTORY_TTL seconds. With a shared cache (Redis, Memcached, the
+# database cache) a bump reaches every worker at once; with the default
+# per-process LocMemCache other workers only pick an edit up when their copy
+# expires, so the TTL bounds how stale a directory can be.
+
+DIRECTORY_VERSION_KEY = 'doctor_directory:version'
+DEFAULT_DIRECTORY_TTL = 60
+SUGGESTION_LIMIT = 10
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+class DoctorDirectory:
+    def __init__(self, doctors):
+        labels = dict(Doctor.SPECIALIZATION_CHOICES)
+        # Ordered by department, then name, so every filtered list is already grouped
+        self.doctors = sorted(doctors, key=lambda doctor: (
+            labels.get(doctor.specialization, doctor.specialization),
+            doctor.user.last_name.lower(),
+            doctor.user.first_name.lower(),
+            doctor.pk,
+        ))
+
+        # Sorted (word, position) pairs: every name word and department word of every doctor
+        words = set()
+        for position, doctor in enumerate(self.doctors):
+            text = ' '.join([
+                doctor.user.first_name, doctor.user.last_name, doctor.specialization,
+                labels.get(doctor.specialization, ''),
+            ])
+            words.update((word, position) for word in _words(text))
+        self.words = sorted(words)
+
+    def _prefix_positions(self, prefix):
+        index = bisect.bisect_left(self.words, (prefix,))
+        positions = set()
+        while index < len(self.words) and self.words[index][0].startswith(prefix):
+            positions.add(self.words[index][1])
+            index += 1
+        return positions
+
+    def search(self, query='', specialization='', weekday=None):
+        """Doctors matching every word of `query` as a prefix, in directory order"""
+        positions = None
+        for prefix in _words(query):
+            matches = self._prefix_positions(prefix)
+            positions = matches if positions is None else positions & matches
+        doctors = self.doctors if positions is None else [self.doctors[position] for position in sorted(positions)]
+
+        if specialization:
+            doctors = [doctor for doctor in doctors if doctor.specialization == specialization]
+        if weekday is not None:
+            doctors = [doctor for doctor in doctors if doctor.available_weekdays & (1 << weekday)]
+        return doctors
+
+    @staticmethod
+    def grouped(entries):
+        """[(department label, [entry, ...]), ...] for (doctor, ...) tuples in search() order"""
+        return [
+            (label, list(members))
+            for label, members in groupby(entries, key=lambda entry: entry[0].get_specialization_display())
+        ]
+
+    def suggest(self, query, limit=SUGGESTION_LIMIT):
+        if not _words(query):
+            return []
+        return [
+            {
+                'id': doctor.pk,
+                'name': f"Dr. {doctor.user.get_full_name()}",
+                'specialization': doctor.get_specialization_display(),
+            }
+            for doctor in self.search(query)[:limit]
+        ]
+
+
+_loaded = (None, None, 0.0)  # (version, DoctorDirectory, monotonic expiry) for this process
+_build_lock = threading.Lock()
+
+
+def _fresh_version():
+    # Never restart from 1: a process may still hold a directory built under an evicted version
+    return time.time_ns()
+
+
+def _version():
+    version = cache.get(DIRECTORY_VERSION_KEY)
+    if version is None:
+        cache.add(DIRECTORY_VERSION_KEY, _fresh_version(), None)
+        version = cache.get(DIRECTORY_VERSION_KEY)
+    return version
+
+
+def get_doctor_directory():
+    """The current directory; one cache read when warm, one query when it has to be rebuilt"""
+    global _loaded
+    version = _version()
+    if _loaded[0] == version and time.monotonic() < _loaded[2]:
+        return _loaded[1]
+    with _build_lock:
+        if _loaded[0] != version or time.monotonic() >= _loaded[2]:
+            ttl = getattr(settings, 'DOCTOR_DIRECTORY_TTL', DEFAULT_DIRECTORY_TTL)
+            directory = DoctorDirectory(Doctor.objects.select_related('user'))
+            _loaded = (version, directory, time.monotonic() + ttl)
+        return _loaded[1]
+
+
+def invalidate_doctor_directory():
+    """Bump the shared version once the current transaction commits (see the note at the top)"""
+    def bump():
+        try:
+            cache.incr(DIRECTORY_VERSION_KEY)
+        except ValueError:
+            cache.set(DIRECTORY_VERSION_KEY, _fresh_version(), None)
+    transaction.on_commit(bump)
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def queue_channel(doctor_id, appointment_date):
+    """Channel carrying queue events for one doctor's day"""
+    return f"doctor-{doctor_id}-{appointment_date.isoformat()}"
+
+
+def channel_date(channel):
+    """The day a queue channel belongs to (None for other channel names)"""
+    try:
+        return date.fromisoformat(channel[-10:])
+    except ValueError:
+        return None
+
+
+def _is_past(channel, today):
+    day = channel_date(channel)
+    return day is not None and day < today
+
+
+class _DailyPruning:
+    """Runs prune(today) on the first publish of each day"""
+    _pruned_on = None
+
+    def _prune_if_new_day(self):
+        today = timezone.now().date()
+        if self._pruned_on != today:
+            self._pruned_on = today
+            self.prune(today)
+
+
+class InProcessEventBus(_DailyPruning):
+    """Ring buffer of recent events per channel; subscribers must live in the same process.
+
+    Channels of past days are dropped once a day, so the buffers do not pile up.
+    """
+    BUFFER_SIZE = 500
+
+    def __init__(self, options):
+        self._condition = threading.Condition()
+        self._channels = {}
+        self._last_id = 0
+
+    def publish(self, channel, event):
+        with self._condition:
+            self._prune_if_new_day()
+            self._last_id += 1
+            self._channels.setdefault(channel, deque(maxlen=self.BUFFER_SIZE)).append((self._last_id, event))
+            self._condition.notify_all()
+
+    def latest_id(self, channel):
+        with self._condition:
+            events = self._channels.get(channel)
+            return events[-1][0] if events else 0
+
+    def prune(self, today):
+        for channel in [channel for channel in self._channels if _is_past(channel, today)]:
+            del self._channels[channel]
+
+    def _events_after(self, channel, last_id):
+        return [(event_id, event) for event_id, event in self._channels.get(channel, ()) if event_id > last_id]
+
+    def wait(self, channel, last_id, timeout):
+        """Events published after `last_id`, blocking up to `timeout` seconds for the first one"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._events_after(channel, last_id), timeout)
+            return self._events_after(channel, last_id)
+
+
+class FileEventBus(_DailyPruning):
+    """Append-only JSON lines per channel, shared by every worker process on the host.
+
+    Event ids are byte offsets into the channel file, so a reconnecting client
+    resumes by seeking straight to its Last-Event-ID. A channel only replays its
+    own day, so files of past days are deleted once a day.
+    """
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, options):
+        if fcntl is None:
+            raise ImproperlyConfigured('FileEventBus needs fcntl file locking (POSIX only).')
+        self.directory = str(options.get('DIRECTORY') or os.path.join(settings.BASE_DIR, 'queue_events'))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, channel):
+        return os.path.join(self.directory, f"{channel}.jsonl")
+
+    def publish(self, channel, event):
+        self._prune_if_new_day()
+        with open(self._path(channel), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.write(json.dumps(event) + '\n')
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def latest_id(self, channel):
+        try:
+            return os.path.getsize(self._path(channel))
+        except OSError:
+            return 0
+
+    def prune(self, today):
+        for name in os.listdir(self.directory):
+            channel, extension = os.path.splitext(name)
+            if extension == '.jsonl' and _is_past(channel, today):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass  # another worker got there first
+
+    def wait(self, channel, last_id, timeout):
+        if last_id > self.latest_id(channel):
+            last_id = 0  # the file was deleted and started again; its offsets are new
+        deadline = time.monotonic() + timeout
+        while self.latest_id(channel) <= last_id and time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+
+        events = []
+        try:
+            with open(self._path(channel), 'rb') as handle:
+                handle.seek(last_id)
+                for line in handle:
+                    if not line.endswith(b'\n'):
+                        break  # still being written
+                    last_id += len(line)
+                    events.append((last_id, json.loads(line)))
+        except OSError:
+            pass
+        return events
+
+
+_event_bus = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus():
+    global _event_bus
+    if _event_bus is None:
+        with _event_bus_lock:
+            if _event_bus is None:
+                options = getattr(settings, 'EVENT_BUS', {})
+                bus_class = import_string(options.get('BACKEND', 'hospital.events.InProcessEventBus'))
+                _event_bus = bus_class(options)
+    return _event_bus
@@ -0,0 +1,124 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+
+# Headers worth replaying; everything else is regenerated by middleware
+REPLAYED_HEADERS = ('Content-Type', 'Location', 'Content-Disposition')
+
+# An attempt that has not finished after this many seconds is treated as abandoned
+LOCK_TIMEOUT = 30
+# Seconds a duplicate is told to wait before retrying while the first attempt runs
+RETRY_AFTER = 1
+
+# Keys and stored responses live in IdempotencyRecord rows rather than the cache:
+# the default cache is per process, and a duplicate POST that lands on another
+# worker has to find the first attempt's key too.
+
+
+def _digest(key):
+    """The stored key depends on the client key alone (scoped to the user by the row)"""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _claim(user, digest):
+    """(record, None) if this request now owns the key, else (None, the record that does)"""
+    from hospital.models import IdempotencyRecord
+
+    now = timezone.now()
+    ttl = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60)
+    IdempotencyRecord.objects.filter(
+        Q(created_at__lt=now - timedelta(seconds=ttl)) |
+        Q(status_code__isnull=True, created_at__lt=now - timedelta(seconds=LOCK_TIMEOUT))
+    ).delete()
+
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(user=user, key=digest), None
+    except IntegrityError:
+        return None, IdempotencyRecord.objects.filter(user=user, key=digest).first()
+
+
+def _replay(request, record):
+    response = HttpResponse(bytes(record.content), status=record.status_code)
+    for name, value in record.headers:
+        response[name] = value
+    response['Idempotent-Replay'] = 'true'
+    if response.has_header('Location'):
+        messages.info(request, 'This request was already submitted.')
+    return response
+
+
+def _in_progress():
+    """Answer for a duplicate that arrives while the first attempt is still running"""
+    response = HttpResponse('This request is still being processed.', status=409)
+    response['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+
+def not_final(response):
+    """Mark a view's failure response (a 200 error payload, a redirect back to the form) as retryable"""
+    response.idempotent_final = False
+    return response
+
+
+def _is_final(response):
+    """Whether a retry with the same key should get this response back.
+
+    Server errors, throttled attempts (429 / Retry-After) and responses the view
+    marked with not_final() are not outcomes: a retry must reach the view again.
+    """
+    if not getattr(response, 'idempotent_final', True):
+        return False
+    if response.streaming or response.status_code >= 500 or response.status_code == 429:
+        return False
+    return not response.has_header('Retry-After')
+
+
+def idempotent(view_func):
+    """Replay the first response for POSTs that repeat an idempotency key.
+
+    Clients send the key as an `Idempotency-Key` header or an `idempotency_key`
+    form field. Responses are kept for IDEMPOTENCY_TTL seconds, so a replay
+    never reaches the view or the appointment tables.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+        if request.method != 'POST' or not key:
+            return view_func(request, *args, **kwargs)
+
+        record, existing = _claim(request.user, _digest(key))
+        if record is None:
+            if existing is None:
+                # The first attempt failed and released the key; process this one normally
+                return view_func(request, *args, **kwargs)
+            if existing.status_code is None:
+                return _in_progress()
+            return _replay(request, existing)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if _is_final(response):
+            record.status_code = response.status_code
+            record.content = response.content
+            record.headers = [(name, response[name]) for name in REPLAYED_HEADERS if response.has_header(name)]
+            record.save(update_fields=['status_code', 'content', 'headers'])
+        else:
+            record.delete()
+        return response
+
+    return wrapper
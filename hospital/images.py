@@ -0,0 +1,123 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+
+from PIL import Image, ImageOps
+
+# Profile image variants. An upload is decoded once, turned upright from its EXIF
+# orientation, cropped square and written at each size in each format. Nothing
+# but pixels is copied over, so EXIF (camera, GPS), ICC and comment blocks are
+# dropped. The variants are stored next to the uploads under names derived from
+# the upload's name, and User.profile_image_variants records them.
+
+PROFILE_IMAGE_SIZES = (32, 128, 512)
+
+# format key: (PIL format, file extension, save options)
+PROFILE_IMAGE_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIRECTORY = 'profile_images/variants'
+
+
+def _decode(field):
+    with field.open('rb') as upload:
+        image = Image.open(upload)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # Flatten onto white: JPEG has no alpha, and avatars are shown on light backgrounds
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(field):
+    """{format: {size: encoded bytes}} for an uploaded ImageField file"""
+    image = _decode(field)
+    side = min(image.size)
+    square = ImageOps.fit(image, (side, side), Image.LANCZOS)
+
+    rendered = {image_format: {} for image_format in PROFILE_IMAGE_FORMATS}
+    # Largest first, each size resampled from the previous one
+    for size in sorted(PROFILE_IMAGE_SIZES, reverse=True):
+        # Small uploads are not blown up past their own size
+        target = min(size, side)
+        if square.width != target:
+            square = square.resize((target, target), Image.LANCZOS)
+        for image_format, (pil_format, _, options) in PROFILE_IMAGE_FORMATS.items():
+            buffer = BytesIO()
+            square.save(buffer, format=pil_format, **options)
+            rendered[image_format][size] = buffer.getvalue()
+    return rendered
+
+
+def _delete_variants(storage, variants, keep=None):
+    keep = keep or {}
+    for image_format in PROFILE_IMAGE_FORMATS:
+        kept = set(keep.get(image_format, {}).values())
+        for name in variants.get(image_format, {}).values():
+            if name not in kept:
+                storage.delete(name)
+
+
+def process_profile_image(user_id):
+    """Bring a user's variants in line with their current upload"""
+    from hospital.models import User
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+    storage = user._meta.get_field('profile_image').storage
+    previous = user.profile_image_variants or {}
+    source = user.profile_image.name if user.profile_image else ''
+    if previous.get('source', '') == source:
+        return
+
+    variants = {}
+    if source:
+        stem = hashlib.sha256(source.encode()).hexdigest()[:16]
+        variants['source'] = source
+        for image_format, sizes in render_variants(user.profile_image).items():
+            extension = PROFILE_IMAGE_FORMATS[image_format][1]
+            variants[image_format] = {}
+            for size, content in sizes.items():
+                name = f'{VARIANT_DIRECTORY}/{user_id}/{stem}-{size}.{extension}'
+                if storage.exists(name):
+                    storage.delete(name)
+                variants[image_format][str(size)] = storage.save(name, ContentFile(content))
+
+    # Only record them if the upload is still the current one
+    current = Q(profile_image=source) if source else Q(profile_image='') | Q(profile_image__isnull=True)
+    if not User.objects.filter(current, pk=user_id).update(profile_image_variants=variants):
+        _delete_variants(storage, variants)  # superseded; the newer upload has its own job
+        return
+    _delete_variants(storage, previous, keep=variants)
+
+    if user.user_type == 'doctor':
+        from hospital.directory import invalidate_doctor_directory
+        invalidate_doctor_directory()
+
+
+# Background processing --------------------------------------------------------
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-images')
+
+
+def _process_in_background(user_id):
+    # If this fails the templates keep serving the original upload
+    try:
+        process_profile_image(user_id)
+    finally:
+        connection.close()
+
+
+def schedule_profile_image(user_id):
+    """Process the user's upload on a worker thread once the current transaction commits"""
+    transaction.on_commit(lambda: _executor.submit(_process_in_background, user_id))
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.models import DailyAppointmentStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailyAppointmentStats rollup from the Appointment table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start_date', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end_date', help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            start_date, end_date = (
+                datetime.strptime(options[key], '%Y-%m-%d').date() if options[key] else None
+                for key in ('start_date', 'end_date')
+            )
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+
+        rows = DailyAppointmentStats.backfill(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily appointment stats rows"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from hospital.images import process_profile_image
+from hospital.models import User
+
+
+class Command(BaseCommand):
+    help = 'Write the resized WebP/JPEG variants for profile images that do not have current ones'
+
+    def handle(self, *args, **options):
+        processed = 0
+        users = User.objects.exclude(profile_image='').exclude(profile_image__isnull=True)
+        for user_id, source, variants in users.values_list('id', 'profile_image', 'profile_image_variants').iterator():
+            if (variants or {}).get('source') == source:
+                continue
+            try:
+                process_profile_image(user_id)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f"User {user_id}: {error}")
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f"{processed} profile images processed"))
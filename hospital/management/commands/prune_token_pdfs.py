@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from hospital.tokens import prune_token_pdfs
+
+
+class Command(BaseCommand):
+    help = "Delete cached appointment token PDFs older than TOKEN_PDF['MAX_AGE_DAYS'] (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override the maximum age in days')
+
+    def handle(self, *args, **options):
+        removed = prune_token_pdfs(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"{removed} token files removed"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from hospital.models import PrescriptionTerm
+from hospital.search import fts_available, lab_report_index, patient_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search indexes (prescription terms and full-text tables) from the source tables'
+
+    def handle(self, *args, **options):
+        terms = PrescriptionTerm.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{PrescriptionTerm._meta.db_table}: {terms} terms indexed"))
+
+        if not fts_available():
+            self.stdout.write(self.style.WARNING(
+                'Full-text indexes need SQLite with FTS5; other backends search with icontains'
+            ))
+            return
+
+        for index in (patient_index, lab_report_index):
+            rows = index.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"{index.table}: {rows} rows indexed"))
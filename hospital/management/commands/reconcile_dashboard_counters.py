@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from hospital.models import DashboardCounter
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard counters from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='Number of days (ending today) whose daily counters are rebuilt',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        dates = [today - timedelta(days=offset) for offset in range(max(options['days'], 1))]
+
+        drifted = DashboardCounter.reconcile(dates)
+        for name, (old, new) in sorted(drifted.items()):
+            self.stdout.write(f"{name}: {old} -> {new}")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled counters ({len(drifted)} corrected)"))
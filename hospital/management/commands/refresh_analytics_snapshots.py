@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from hospital.snapshots import AppointmentSnapshot, LabReportSnapshot, snapshot_directory
+
+
+class Command(BaseCommand):
+    help = 'Refresh the columnar analytics snapshots (run from cron to keep dashboard hits cheap)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild from scratch instead of refreshing')
+
+    def handle(self, *args, **options):
+        for snapshot_class in (AppointmentSnapshot, LabReportSnapshot):
+            snapshot = snapshot_class(snapshot_directory())
+            rows = snapshot.rebuild() if options['rebuild'] else snapshot.refresh()
+            self.stdout.write(self.style.SUCCESS(f"{snapshot.name}: {rows} rows written"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2025-10-20 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0009_labreport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='labreport',
+            name='report_file',
+            field=models.FileField(upload_to='lab_reports/'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2025-11-04 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0010_alter_labreport_report_file'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='user',
+            options={},
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_image',
+            field=models.ImageField(blank=True, help_text='Upload a profile picture (optional)', null=True, upload_to='profile_images/'),
+        ),
+        migrations.AlterModelTable(
+            name='user',
+            table='auth_user',
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:55
+
+from datetime import datetime, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, IntegerField, Max, Value, When
+
+
+def renumber_duplicate_tokens(apps, schema_editor):
+    """Move duplicated tokens to the end of the day so the unique constraint can be added.
+
+    In each group of rows sharing a token, a live (non-cancelled) appointment
+    keeps the token and cancelled rows are the first to move. Moved rows get the
+    estimated time of their new token (10 minutes per token from the doctor's start).
+    """
+    Appointment = apps.get_model('hospital', 'Appointment')
+
+    seen = set()
+    last_tokens = {}
+    duplicates = []
+    appointments = Appointment.objects.select_related('doctor').annotate(
+        is_cancelled=Case(When(status='cancelled', then=Value(1)), default=Value(0), output_field=IntegerField())
+    ).order_by('doctor_id', 'appointment_date', 'token_number', 'is_cancelled', 'id')
+    for appointment in appointments:
+        day = (appointment.doctor_id, appointment.appointment_date)
+        last_tokens[day] = max(last_tokens.get(day, 0), appointment.token_number)
+        if (day, appointment.token_number) in seen:
+            duplicates.append(appointment)
+        seen.add((day, appointment.token_number))
+
+    for appointment in duplicates:
+        day = (appointment.doctor_id, appointment.appointment_date)
+        last_tokens[day] += 1
+        appointment.token_number = last_tokens[day]
+        start = datetime.combine(appointment.appointment_date, appointment.doctor.start_time)
+        appointment.estimated_time = (start + timedelta(minutes=(appointment.token_number - 1) * 10)).time()
+        appointment.save(update_fields=['token_number', 'estimated_time'])
+
+
+def backfill_daily_queues(apps, schema_editor):
+    Appointment = apps.get_model('hospital', 'Appointment')
+    DailyQueue = apps.get_model('hospital', 'DailyQueue')
+
+    days = Appointment.objects.values('doctor_id', 'appointment_date').annotate(last_token=Max('token_number'))
+    DailyQueue.objects.bulk_create([DailyQueue(**day) for day in days], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0011_alter_user_options_user_profile_image_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyQueue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('last_token', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_queues', to='hospital.doctor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyqueue',
+            constraint=models.UniqueConstraint(fields=('doctor', 'appointment_date'), name='unique_daily_queue'),
+        ),
+        migrations.RunPython(renumber_duplicate_tokens, migrations.RunPython.noop),
+        migrations.RunPython(backfill_daily_queues, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('doctor', 'appointment_date', 'token_number'), name='unique_token_per_doctor_day'),
+        ),
+    ]
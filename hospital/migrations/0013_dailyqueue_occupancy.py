@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:56
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_occupancy(apps, schema_editor):
+    Appointment = apps.get_model('hospital', 'Appointment')
+    DailyQueue = apps.get_model('hospital', 'DailyQueue')
+
+    days = Appointment.objects.values('doctor_id', 'appointment_date').annotate(
+        scheduled=Count('id', filter=Q(status='scheduled')),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    for day in days:
+        DailyQueue.objects.filter(doctor_id=day['doctor_id'], appointment_date=day['appointment_date']).update(
+            scheduled_count=day['scheduled'],
+            completed_count=day['completed'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0012_dailyqueue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyqueue',
+            name='completed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyqueue',
+            name='scheduled_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:57
+
+from django.db import migrations, models
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def populate_available_weekdays(apps, schema_editor):
+    Doctor = apps.get_model('hospital', 'Doctor')
+
+    for doctor in Doctor.objects.all():
+        days = {day.strip().lower() for day in doctor.available_days.split(',')}
+        doctor.available_weekdays = sum(1 << index for index, day in enumerate(WEEKDAYS) if day in days)
+        doctor.available_days = ','.join(day for day in WEEKDAYS if day in days)
+        doctor.save(update_fields=['available_weekdays', 'available_days'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0013_dailyqueue_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='available_weekdays',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(populate_available_weekdays, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0014_doctor_available_weekdays'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='unique_token_per_doctor_day',
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'cancelled'), _negated=True), fields=('doctor', 'appointment_date', 'token_number'), name='unique_token_per_doctor_day'),
+        ),
+    ]
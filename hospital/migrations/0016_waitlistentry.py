@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0015_token_constraint_excludes_cancelled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('reason', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('promoted', 'Promoted'), ('left', 'Left')], default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='hospital.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='hospital.doctor')),
+                ('patient', models.ForeignKey(limit_choices_to={'user_type': 'patient'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['appointment_date', 'doctor', 'id'],
+                'indexes': [models.Index(fields=['doctor', 'appointment_date', 'status', 'id'], name='waitlist_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('patient', 'doctor', 'appointment_date'), name='unique_waiting_patient_per_day')],
+            },
+        ),
+    ]
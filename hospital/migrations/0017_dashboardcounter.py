@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:02
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def seed_counters(apps, schema_editor):
+    DashboardCounter = apps.get_model('hospital', 'DashboardCounter')
+    User = apps.get_model('hospital', 'User')
+    Patient = apps.get_model('hospital', 'Patient')
+    Doctor = apps.get_model('hospital', 'Doctor')
+    Appointment = apps.get_model('hospital', 'Appointment')
+    LabReport = apps.get_model('hospital', 'LabReport')
+
+    counts = {
+        'users': User.objects.count(),
+        'patients': Patient.objects.count(),
+        'doctors': Doctor.objects.count(),
+        'lab_reports': LabReport.objects.count(),
+    }
+    for row in Appointment.objects.values('appointment_date').annotate(
+        total=Count('id'), completed=Count('id', filter=Q(status='completed'))
+    ):
+        date = row['appointment_date'].isoformat()
+        counts[f'appointments:{date}'] = row['total']
+        counts[f'appointments_completed:{date}'] = row['completed']
+    for row in LabReport.objects.annotate(day=TruncDate('uploaded_at')).values('day').annotate(total=Count('id')):
+        counts[f"lab_reports:{row['day'].isoformat()}"] = row['total']
+    for row in User.objects.filter(last_login__isnull=False).annotate(
+        day=TruncDate('last_login')
+    ).values('day').annotate(total=Count('id')):
+        counts[f"active_users:{row['day'].isoformat()}"] = row['total']
+
+    DashboardCounter.objects.bulk_create(
+        [DashboardCounter(name=name, value=value) for name, value in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0016_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
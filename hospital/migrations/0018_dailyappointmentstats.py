@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_stats(apps, schema_editor):
+    Appointment = apps.get_model('hospital', 'Appointment')
+    DailyAppointmentStats = apps.get_model('hospital', 'DailyAppointmentStats')
+    rows = Appointment.objects.values('appointment_date', 'doctor_id', 'status').annotate(count=Count('id'))
+    DailyAppointmentStats.objects.bulk_create([DailyAppointmentStats(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0017_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAppointmentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='hospital.doctor')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily appointment stats',
+                'constraints': [models.UniqueConstraint(fields=('appointment_date', 'doctor', 'status'), name='unique_daily_appointment_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
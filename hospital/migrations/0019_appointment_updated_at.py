@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_created_at(apps, schema_editor):
+    Appointment = apps.get_model('hospital', 'Appointment')
+    Appointment.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0018_dailyappointmentstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# FTS5 only exists on SQLite; other backends search with icontains (see hospital/search.py)
+
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS hospital_patient_search USING fts5("
+    "first_name, last_name, username, email, phone, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+POPULATE_INDEX = (
+    "INSERT INTO hospital_patient_search(rowid, first_name, last_name, username, email, phone) "
+    "SELECT p.id, u.first_name, u.last_name, u.username, u.email, u.phone "
+    "FROM hospital_patient p JOIN auth_user u ON u.id = p.user_id"
+)
+
+
+def fts5_supported(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'")
+        return cursor.fetchone() is not None
+
+
+def create_search_index(apps, schema_editor):
+    if fts5_supported(schema_editor):
+        schema_editor.execute(CREATE_INDEX)
+        schema_editor.execute(POPULATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS hospital_patient_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0019_appointment_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
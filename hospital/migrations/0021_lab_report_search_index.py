@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# FTS5 only exists on SQLite; other backends search with icontains (see hospital/search.py)
+
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS hospital_labreport_search USING fts5("
+    "test_name, findings, notes, patient_name, doctor_name, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+POPULATE_INDEX = (
+    "INSERT INTO hospital_labreport_search(rowid, test_name, findings, notes, patient_name, doctor_name) "
+    "SELECT l.id, l.test_name, l.findings, l.notes, "
+    "pu.first_name || ' ' || pu.last_name, du.first_name || ' ' || du.last_name "
+    "FROM hospital_labreport l "
+    "JOIN hospital_appointment a ON a.id = l.appointment_id "
+    "JOIN auth_user pu ON pu.id = a.patient_id "
+    "JOIN hospital_doctor d ON d.id = l.doctor_id "
+    "JOIN auth_user du ON du.id = d.user_id"
+)
+
+
+def fts5_supported(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'")
+        return cursor.fetchone() is not None
+
+
+def create_search_index(apps, schema_editor):
+    if fts5_supported(schema_editor):
+        schema_editor.execute(CREATE_INDEX)
+        schema_editor.execute(POPULATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS hospital_labreport_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0020_patient_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:15
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_prescriptions(apps, schema_editor):
+    Prescription = apps.get_model('hospital', 'Prescription')
+    PrescriptionTerm = apps.get_model('hospital', 'PrescriptionTerm')
+    terms = []
+    for prescription_id, text, doctor_id in Prescription.objects.values_list(
+        'id', 'prescription_text', 'appointment__doctor_id'
+    ).iterator():
+        for term in {term[:64] for term in re.findall(r'\w+', text.lower()) if len(term) > 1}:
+            terms.append(PrescriptionTerm(term=term, prescription_id=prescription_id, doctor_id=doctor_id))
+        if len(terms) >= 5000:
+            PrescriptionTerm.objects.bulk_create(terms)
+            terms = []
+    PrescriptionTerm.objects.bulk_create(terms)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0021_lab_report_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrescriptionTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='hospital.doctor')),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='hospital.prescription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'doctor'], name='prescription_term_doctor_idx')],
+                'constraints': [models.UniqueConstraint(fields=('prescription', 'term'), name='unique_prescription_term')],
+            },
+        ),
+        migrations.RunPython(index_prescriptions, migrations.RunPython.noop),
+    ]
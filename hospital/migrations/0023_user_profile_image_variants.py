@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0022_prescriptionterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
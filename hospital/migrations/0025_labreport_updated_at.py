@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_uploaded_at(apps, schema_editor):
+    LabReport = apps.get_model('hospital', 'LabReport')
+    LabReport.objects.update(updated_at=F('uploaded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0024_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labreport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_uploaded_at, migrations.RunPython.noop),
+    ]
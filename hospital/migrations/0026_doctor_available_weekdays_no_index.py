@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0025_labreport_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='available_weekdays',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 from datetime import datetime, timedelta
 
+from hospital.search import tokenize_terms
+from hospital.signals import queue_resequenced
+
 
 # Create your models here.
 class User(AbstractUser):
@@ -20,6 +27,16 @@ class User(AbstractUser):
         null=True,
         help_text='Upload a profile picture (optional)'
     )
+    # Resized, metadata-free copies written by hospital/images.py:
+    # {'source': <profile_image name>, 'webp': {'32': <name>, ...}, 'jpeg': {...}}
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the login signal tell a user's first login of the day from a repeat one
+        instance._loaded_last_login = instance.__dict__.get('last_login')
+        return instance
 
     def get_user_type_display(self):
         """Get human-readable user type"""
@@ -28,12 +45,29 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.user_type})"
 
+    def profile_image_variant_url(self, size=128, image_format='webp'):
+        """URL of the smallest processed variant covering `size` px, the upload itself until it is processed"""
+        if not self.profile_image:
+            return '/static/images/default-avatar.png'  # You'll need to create this
+        variants = self.profile_image_variants or {}
+        if variants.get('source') != self.profile_image.name or not variants.get(image_format):
+            return self.profile_image.url
+        sizes = sorted(int(variant_size) for variant_size in variants[image_format])
+        chosen = next((variant_size for variant_size in sizes if variant_size >= size), sizes[-1])
+        return self.profile_image.storage.url(variants[image_format][str(chosen)])
+
     @property
     def profile_image_url(self):
         """Return profile image URL or default avatar"""
-        if self.profile_image and hasattr(self.profile_image, 'url'):
-            return self.profile_image.url
-        return '/static/images/default-avatar.png'  # You'll need to create this
+        return self.profile_image_variant_url(128)
+
+    @property
+    def profile_image_thumbnail_url(self):
+        return self.profile_image_variant_url(32)
+
+    @property
+    def profile_image_large_url(self):
+        return self.profile_image_variant_url(512)
 
     class Meta:
         # Add this to avoid conflicts in future migrations
@@ -56,6 +90,26 @@ class Patient(models.Model):
         return f"#{self.user_id} {self.user.get_full_name()}"
 
 
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def weekday_mask(days):
+    """Convert day names (list or comma-separated string) to a 7-bit mask, Monday = bit 0"""
+    if isinstance(days, str):
+        days = days.split(',')
+    mask = 0
+    for day in days:
+        day = day.strip().lower()
+        if day in WEEKDAYS:
+            mask |= 1 << WEEKDAYS.index(day)
+    return mask
+
+
+def weekdays_from_mask(mask):
+    """Day names set in a weekday mask, Monday first"""
+    return [day for index, day in enumerate(WEEKDAYS) if mask & (1 << index)]
+
+
 class Doctor(models.Model):
     SPECIALIZATION_CHOICES = [
         ('cardiology', 'Cardiology'),
@@ -74,12 +128,28 @@ class Doctor(models.Model):
     specialization = models.CharField(max_length=100, choices=SPECIALIZATION_CHOICES, default='general')
     start_time = models.TimeField(default='09:00:00')
     end_time = models.TimeField(default='17:00:00')
-    available_days = models.CharField(max_length=100)  # monday, tuesday, ...
+    available_days = models.CharField(max_length=100)  # monday, tuesday, ... (derived from available_weekdays)
+    available_weekdays = models.PositiveSmallIntegerField(default=0)  # bit 0 = Monday
     max_appointments = models.IntegerField(default=50)
 
+    def save(self, *args, **kwargs):
+        # Forms edit the day names; store them as a mask and keep the string in canonical form
+        self.available_weekdays = weekday_mask(self.available_days)
+        self.available_days = ','.join(weekdays_from_mask(self.available_weekdays))
+        super().save(*args, **kwargs)
+
     def get_available_days_list(self):
-        """Convert comma-separated string to list"""
-        return self.available_days.split(',') if self.available_days else []
+        """Available day names, Monday first"""
+        return weekdays_from_mask(self.available_weekdays)
+
+    def works_on(self, date):
+        """Check if the doctor is available on the weekday of `date`"""
+        return bool(self.available_weekdays & (1 << date.weekday()))
+
+    def estimated_time_for_token(self, appointment_date, token_number):
+        """Estimated consultation time for a token (10 minutes per patient)"""
+        start_datetime = datetime.combine(appointment_date, self.start_time)
+        return (start_datetime + timedelta(minutes=(token_number - 1) * 10)).time()
 
     def __str__(self):
         return f"Dr. {self.user.get_full_name()}, {self.qualification} - {self.specialization.capitalize()}"
@@ -98,36 +168,87 @@ class Appointment(models.Model):
     ), default='scheduled')
     reason = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    def save(self, *args, **kwargs):
-        if not self.token_number or self.token_number == 0:
-            # Get the last token number for this doctor on this date
-            last_appointment = Appointment.objects.filter(
-                doctor=self.doctor,
-                appointment_date=self.appointment_date,
-                status='scheduled'
-            ).order_by('-token_number').first()
-
-            if last_appointment:
-                self.token_number = last_appointment.token_number + 1
-            else:
-                self.token_number = 1  # First appointment of the day
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status and day so save() can keep DailyQueue counts in sync
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_day = (instance.__dict__.get('doctor_id'), instance.__dict__.get('appointment_date'))
+        return instance
 
-        # Calculate and store estimated time
-        if not self.estimated_time:
-            self.estimated_time = self.calculate_estimated_time()
+    @property
+    def stored_day(self):
+        """(doctor_id, appointment_date) as last loaded or saved"""
+        loaded_day = getattr(self, '_loaded_day', None)
+        if loaded_day is None or None in loaded_day:
+            return (self.doctor_id, self.appointment_date)
+        return loaded_day
 
-        super().save(*args, **kwargs)
+    def save(self, *args, **kwargs):
+        # Token allocation and the insert share one transaction so a failed
+        # insert does not burn a token from the doctor's daily counter
+        with transaction.atomic():
+            previous_status = getattr(self, '_loaded_status', None)
+            stats_status = None if self._state.adding else previous_status
+            day = (self.doctor_id, self.appointment_date)
+            capacity = self.doctor.max_appointments if self.status in DailyQueue.STATUS_COUNTERS else None
+
+            if self._state.adding:
+                if not self.token_number or self.token_number == 0:
+                    self.token_number = DailyQueue.reserve_token(
+                        self.doctor_id, self.appointment_date, self.doctor.max_appointments
+                    )
+                    previous_status = 'scheduled'
+                else:
+                    # A caller-chosen token still has to fit the day and move
+                    # last_token past it so reserve_token() never hands it out again
+                    DailyQueue.claim_token(self.doctor_id, self.appointment_date, self.token_number, capacity)
+                    previous_status = None
+            elif self.stored_day != day:
+                # Moved to another doctor or day: leave the old day's counters
+                # and join the new day's queue behind its last token
+                self._release_counters(previous_status)
+                previous_status = stats_status = None
+                self.token_number = DailyQueue.claim_token(self.doctor_id, self.appointment_date, capacity=capacity)
+                self.estimated_time = self.calculate_estimated_time()
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'token_number', 'estimated_time'}
+
+            # Calculate and store estimated time
+            if not self.estimated_time:
+                self.estimated_time = self.calculate_estimated_time()
+
+            super().save(*args, **kwargs)
+
+            if previous_status != self.status:
+                DailyQueue.record_status_change(self.doctor_id, self.appointment_date, previous_status, self.status)
+                self._invalidate_availability()
+            if stats_status != self.status:
+                DailyAppointmentStats.record_transition(self.doctor_id, self.appointment_date, stats_status, self.status)
+            self._loaded_status = self.status
+            self._loaded_day = day
+
+    def _release_counters(self, status):
+        """Take the appointment out of the counters of the day it was stored on"""
+        day = self.stored_day
+        DailyQueue.record_status_change(*day, status, None)
+        DailyAppointmentStats.record_transition(*day, status, None)
+        self._invalidate_availability(day)
+
+    def release_counters(self):
+        """Counter bookkeeping for a deleted appointment (see signals.appointment_released)"""
+        self._release_counters(getattr(self, '_loaded_status', None) or self.status)
+
+    def _invalidate_availability(self, day=None):
+        from hospital.availability import invalidate_doctor_availability
+        doctor_id, appointment_date = day or (self.doctor_id, self.appointment_date)
+        transaction.on_commit(lambda: invalidate_doctor_availability(doctor_id, appointment_date))
 
     def calculate_estimated_time(self):
         """Calculate estimated time based on token number (10 minutes per patient)"""
-        if self.token_number == 1:
-            return self.doctor.start_time
-        else:
-            # Start time + (token_number - 1) * 10 minutes
-            start_datetime = datetime.combine(self.appointment_date, self.doctor.start_time)
-            estimated_datetime = start_datetime + timedelta(minutes=(self.token_number - 1) * 10)
-            return estimated_datetime.time()
+        return self.doctor.estimated_time_for_token(self.appointment_date, self.token_number)
 
     def can_cancel(self):
         """Check if appointment can be cancelled"""
@@ -150,11 +271,74 @@ class Appointment(models.Model):
     def cancel(self):
         """Cancel the appointment"""
         if self.can_cancel():
-            self.status = 'cancelled'
-            self.save()
+            with transaction.atomic():
+                self.status = 'cancelled'
+                self.save()
+                if getattr(settings, 'COMPACT_QUEUE_ON_CANCEL', False):
+                    Appointment.compact_queue(self.doctor, self.appointment_date)
+                # The freed slot goes to the first patient waiting for this day
+                WaitlistEntry.promote_next(self.doctor, self.appointment_date)
             return True
         return False
 
+    @classmethod
+    def compact_queue(cls, doctor, appointment_date):
+        """Close token gaps left by cancellations and recompute estimated times.
+
+        Completed appointments keep their tokens; scheduled ones move down into
+        the free numbers in token order. Runs in a constant number of queries
+        regardless of how many patients the day holds.
+        """
+        with transaction.atomic():
+            queue = DailyQueue.objects.select_for_update().filter(
+                doctor=doctor,
+                appointment_date=appointment_date
+            ).first()
+            active = list(
+                cls.objects.filter(doctor=doctor, appointment_date=appointment_date)
+                .exclude(status='cancelled')
+                .order_by('token_number')
+            )
+            completed_tokens = {appointment.token_number for appointment in active if appointment.status == 'completed'}
+
+            moved = []
+            next_token = 1
+            for appointment in active:
+                if appointment.status == 'completed':
+                    continue
+                while next_token in completed_tokens:
+                    next_token += 1
+                if appointment.token_number != next_token:
+                    appointment.token_number = next_token
+                    appointment.estimated_time = doctor.estimated_time_for_token(appointment_date, next_token)
+                    moved.append(appointment)
+                next_token += 1
+
+            if moved:
+                # Park the moved rows on negative tokens first so the unique
+                # constraint never sees two rows on the same number mid-update
+                final_tokens = [appointment.token_number for appointment in moved]
+                for appointment in moved:
+                    appointment.token_number = -appointment.token_number
+                cls.objects.bulk_update(moved, ['token_number'])
+                now = timezone.now()
+                for appointment, token_number in zip(moved, final_tokens):
+                    appointment.token_number = token_number
+                    appointment.updated_at = now
+                cls.objects.bulk_update(moved, ['token_number', 'estimated_time', 'updated_at'])
+                queue_resequenced.send(
+                    sender=cls,
+                    doctor_id=doctor.id,
+                    appointment_date=appointment_date,
+                    appointment_ids=[appointment.id for appointment in moved]
+                )
+
+            if queue:
+                queue.last_token = max((appointment.token_number for appointment in active), default=0)
+                queue.save(update_fields=['last_token'])
+
+            return moved
+
     def can_prescribe(self):
         """Check if doctor can prescribe medicine for this appointment"""
         from django.utils import timezone
@@ -187,6 +371,262 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['appointment_date', 'doctor', 'token_number']
+        constraints = [
+            # Cancelled appointments give their token up (see compact_queue)
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'token_number'],
+                condition=~Q(status='cancelled'),
+                name='unique_token_per_doctor_day',
+            ),
+        ]
+
+
+class DoctorFullyBooked(Exception):
+    """Raised when a doctor has no capacity left on the requested day"""
+
+
+class DailyQueue(models.Model):
+    """Token counter and occupancy for one doctor on one day"""
+    STATUS_COUNTERS = {
+        'scheduled': 'scheduled_count',
+        'completed': 'completed_count',
+    }
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_queues')
+    appointment_date = models.DateField()
+    last_token = models.IntegerField(default=0)
+    scheduled_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+
+    @property
+    def booked_count(self):
+        """Appointments holding a slot (cancelled ones free theirs)"""
+        return self.scheduled_count + self.completed_count
+
+    def remaining_for(self, doctor):
+        return max(doctor.max_appointments - self.booked_count, 0)
+
+    @classmethod
+    def reserve_token(cls, doctor_id, appointment_date, capacity):
+        """Reserve the next token and a slot for a doctor's day with a single upsert.
+
+        Raises DoctorFullyBooked when the day already holds `capacity` appointments.
+        """
+        if connection.features.supports_update_conflicts_with_target:
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} (doctor_id, appointment_date, last_token, scheduled_count, completed_count) "
+                    f"VALUES (%s, %s, 1, 1, 0) "
+                    f"ON CONFLICT (doctor_id, appointment_date) "
+                    f"DO UPDATE SET last_token = {table}.last_token + 1, "
+                    f"scheduled_count = {table}.scheduled_count + 1 "
+                    f"WHERE {table}.scheduled_count + {table}.completed_count < %s "
+                    f"RETURNING last_token",
+                    [doctor_id, connection.ops.adapt_datefield_value(appointment_date), capacity]
+                )
+                row = cursor.fetchone()
+            if row is None:
+                raise DoctorFullyBooked()
+            return row[0]
+
+        # Backends without ON CONFLICT: lock the counter row instead
+        with transaction.atomic():
+            queue, _ = cls.objects.select_for_update().get_or_create(
+                doctor_id=doctor_id,
+                appointment_date=appointment_date
+            )
+            if queue.booked_count >= capacity:
+                raise DoctorFullyBooked()
+            cls.objects.filter(pk=queue.pk).update(
+                last_token=F('last_token') + 1,
+                scheduled_count=F('scheduled_count') + 1
+            )
+            return queue.last_token + 1
+
+    @classmethod
+    def claim_token(cls, doctor_id, appointment_date, token_number=None, capacity=None):
+        """Record a token chosen by the caller (the next one when None) and return it.
+
+        last_token is moved up to `token_number`; with a `capacity`, raises
+        DoctorFullyBooked when the day has no slot left. The slot itself is
+        counted by record_status_change() once the appointment is saved.
+        """
+        with transaction.atomic():
+            queue, _ = cls.objects.select_for_update().get_or_create(
+                doctor_id=doctor_id,
+                appointment_date=appointment_date
+            )
+            if capacity is not None and queue.booked_count >= capacity:
+                raise DoctorFullyBooked()
+            if token_number is None:
+                token_number = queue.last_token + 1
+            cls.objects.filter(pk=queue.pk).update(last_token=Greatest(F('last_token'), token_number))
+            return token_number
+
+    @classmethod
+    def record_status_change(cls, doctor_id, appointment_date, old_status, new_status):
+        """Move one appointment between the per-status counters"""
+        changes = {}
+        if old_status in cls.STATUS_COUNTERS:
+            field = cls.STATUS_COUNTERS[old_status]
+            changes[field] = F(field) - 1
+        if new_status in cls.STATUS_COUNTERS:
+            field = cls.STATUS_COUNTERS[new_status]
+            changes[field] = changes.get(field, F(field)) + 1
+        if not changes:
+            return
+
+        queue_day = cls.objects.filter(doctor_id=doctor_id, appointment_date=appointment_date)
+        # A missing row has nothing to take away (e.g. its doctor is being deleted)
+        if not queue_day.update(**changes) and new_status in cls.STATUS_COUNTERS:
+            cls.objects.get_or_create(doctor_id=doctor_id, appointment_date=appointment_date)
+            queue_day.update(**changes)
+
+    @classmethod
+    def for_day(cls, doctor, appointment_date):
+        """Return the (possibly unsaved) queue for a doctor's day without creating it"""
+        queue = cls.objects.filter(doctor=doctor, appointment_date=appointment_date).first()
+        return queue or cls(doctor=doctor, appointment_date=appointment_date)
+
+    def __str__(self):
+        return f"Dr. {self.doctor.user.get_full_name()} on {self.appointment_date} - last token #{self.last_token}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'appointment_date'], name='unique_daily_queue'),
+        ]
+
+
+class DailyAppointmentStats(models.Model):
+    """Appointments per (day, doctor, status), kept current by Appointment.save() and deletes.
+
+    Reporting views aggregate these rows instead of scanning Appointment, so
+    their cost follows the number of days rather than the number of bookings.
+    """
+    appointment_date = models.DateField()
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_stats')
+    status = models.CharField(max_length=20, choices=Appointment._meta.get_field('status').choices)
+    count = models.IntegerField(default=0)
+
+    @classmethod
+    def record_transition(cls, doctor_id, appointment_date, old_status, new_status):
+        """Move one appointment from old_status to new_status (None for insert/delete)"""
+        for status, delta in ((old_status, -1), (new_status, 1)):
+            if status is None:
+                continue
+            row = cls.objects.filter(doctor_id=doctor_id, appointment_date=appointment_date, status=status)
+            if not row.update(count=F('count') + delta) and delta > 0:
+                cls.objects.get_or_create(doctor_id=doctor_id, appointment_date=appointment_date, status=status)
+                row.update(count=F('count') + delta)
+
+    @classmethod
+    def backfill(cls, start_date=None, end_date=None):
+        """Rebuild the rollup for a date range (everything when no range is given)"""
+        from django.db.models import Count
+
+        appointments = Appointment.objects.all()
+        stats = cls.objects.all()
+        if start_date:
+            appointments = appointments.filter(appointment_date__gte=start_date)
+            stats = stats.filter(appointment_date__gte=start_date)
+        if end_date:
+            appointments = appointments.filter(appointment_date__lte=end_date)
+            stats = stats.filter(appointment_date__lte=end_date)
+
+        rows = [
+            cls(**row)
+            for row in appointments.values('appointment_date', 'doctor_id', 'status').annotate(count=Count('id'))
+        ]
+        with transaction.atomic():
+            stats.delete()
+            cls.objects.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+    def __str__(self):
+        return f"{self.appointment_date} Dr. #{self.doctor_id} {self.status}: {self.count}"
+
+    class Meta:
+        verbose_name_plural = 'Daily appointment stats'
+        constraints = [
+            models.UniqueConstraint(fields=['appointment_date', 'doctor', 'status'], name='unique_daily_appointment_stats'),
+        ]
+
+
+class WaitlistEntry(models.Model):
+    """Patient waiting for a slot on a doctor's fully booked day (served FIFO)"""
+    STATUS_CHOICES = (
+        ('waiting', 'Waiting'),
+        ('promoted', 'Promoted'),
+        ('left', 'Left'),
+    )
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='waitlist_entries')
+    appointment_date = models.DateField()
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'user_type': 'patient'})
+    reason = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    appointment = models.OneToOneField(Appointment, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def promote_next(cls, doctor, appointment_date):
+        """Book the first waiting patient into a freed slot; returns the new appointment or None"""
+        from hospital.waitlist import invalidate_waitlist_positions
+
+        with transaction.atomic():
+            waiting = cls.objects.select_for_update().filter(
+                doctor=doctor,
+                appointment_date=appointment_date,
+                status='waiting'
+            ).order_by('id')
+            skipped = False
+            for entry in waiting:
+                # Patients who got a slot some other way since joining drop off the list
+                if not Appointment.objects.filter(
+                    patient_id=entry.patient_id, doctor=doctor, appointment_date=appointment_date
+                ).exclude(status='cancelled').exists():
+                    break
+                entry.status = 'left'
+                entry.save(update_fields=['status'])
+                skipped = True
+            else:
+                if skipped:
+                    transaction.on_commit(lambda: invalidate_waitlist_positions(doctor.id, appointment_date))
+                return None
+
+            try:
+                appointment = Appointment.objects.create(
+                    patient=entry.patient,
+                    doctor=doctor,
+                    appointment_date=appointment_date,
+                    reason=entry.reason
+                )
+            except DoctorFullyBooked:
+                return None
+
+            entry.status = 'promoted'
+            entry.appointment = appointment
+            entry.save(update_fields=['status', 'appointment'])
+
+        transaction.on_commit(lambda: invalidate_waitlist_positions(doctor.id, appointment_date))
+        return appointment
+
+    def __str__(self):
+        return f"{self.patient.username} waiting for Dr. {self.doctor.user.get_full_name()} on {self.appointment_date}"
+
+    class Meta:
+        ordering = ['appointment_date', 'doctor', 'id']
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date', 'status', 'id'], name='waitlist_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['patient', 'doctor', 'appointment_date'],
+                condition=Q(status='waiting'),
+                name='unique_waiting_patient_per_day',
+            ),
+        ]
 
 
 class Prescription(models.Model):
@@ -195,10 +635,84 @@ class Prescription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.index_terms()
+
+    def index_terms(self):
+        """Bring the PrescriptionTerm rows in line with the current text"""
+        terms = tokenize_terms(self.prescription_text)
+        existing = set(self.terms.values_list('term', flat=True))
+        if existing - terms:
+            self.terms.filter(term__in=existing - terms).delete()
+        if terms - existing:
+            PrescriptionTerm.objects.bulk_create([
+                PrescriptionTerm(term=term, prescription=self, doctor_id=self.appointment.doctor_id)
+                for term in terms - existing
+            ])
+
     def __str__(self):
         return f"Prescription for {self.appointment.patient.get_full_name()}"
 
 
+class PrescriptionTerm(models.Model):
+    """Inverted index over prescription text: one row per distinct word per prescription"""
+    term = models.CharField(max_length=64)
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='terms')
+    # Copied from the appointment so doctor-scoped searches stay on the (term, doctor) index
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'doctor'], name='prescription_term_doctor_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['prescription', 'term'], name='unique_prescription_term'),
+        ]
+
+    @classmethod
+    def filter_appointments(cls, appointments, query, doctor=None):
+        """Appointments whose prescription contains every word of `query` (as prefixes)"""
+        terms = tokenize_terms(query)
+        if not terms:
+            return appointments.none()
+        for term in terms:
+            # A range rather than LIKE 'term%' so the (term, doctor) index serves the prefix
+            lookup = {
+                'prescription__terms__term__gte': term,
+                'prescription__terms__term__lt': term[:-1] + chr(ord(term[-1]) + 1),
+            }
+            if doctor is not None:
+                lookup['prescription__terms__doctor'] = doctor
+            appointments = appointments.filter(**lookup)
+        # One prefix can match several words of the same prescription
+        return appointments.distinct()
+
+    @classmethod
+    def rebuild(cls):
+        """Re-index every prescription from scratch; returns the number of terms"""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            terms, total = [], 0
+            for prescription_id, text, doctor_id in Prescription.objects.values_list(
+                'id', 'prescription_text', 'appointment__doctor_id'
+            ).iterator(chunk_size=2000):
+                terms += [
+                    cls(term=term, prescription_id=prescription_id, doctor_id=doctor_id)
+                    for term in tokenize_terms(text)
+                ]
+                if len(terms) >= 5000:
+                    cls.objects.bulk_create(terms)
+                    total += len(terms)
+                    terms = []
+            cls.objects.bulk_create(terms)
+        return total + len(terms)
+
+    def __str__(self):
+        return f"{self.term} (prescription #{self.prescription_id})"
+
+
 class LabReport(models.Model):
     REPORT_TYPES = [
         ('blood_test', 'Blood Test'),
@@ -219,9 +733,87 @@ class LabReport(models.Model):
     findings = models.TextField(blank=True, help_text="Key findings or summary")
     notes = models.TextField(blank=True, help_text="Additional notes for patient")
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.test_name} - {self.appointment.patient.get_full_name()}"
 
     class Meta:
-        ordering = ['-uploaded_at']
\ No newline at end of file
+        ordering = ['-uploaded_at']
+
+
+class DashboardCounter(models.Model):
+    """Named counter maintained by signals so the admin dashboard never runs COUNT(*).
+
+    Totals use plain names ('doctors'); daily counters are suffixed with the
+    date ('appointments:2025-11-04').
+    """
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @staticmethod
+    def daily(name, date):
+        return f"{name}:{date.isoformat()}"
+
+    @classmethod
+    def bump(cls, name, delta=1):
+        counter = cls.objects.filter(name=name)
+        if not counter.update(value=F('value') + delta):
+            cls.objects.get_or_create(name=name)
+            counter.update(value=F('value') + delta)
+
+    @classmethod
+    def values_for(cls, names):
+        """Current values for `names` in one query (missing counters read as 0)"""
+        values = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return {name: values.get(name, 0) for name in names}
+
+    @classmethod
+    def reconcile(cls, dates):
+        """Recompute totals and the daily counters for `dates` from the source tables.
+
+        Returns {name: (old, new)} for every counter that had drifted.
+        """
+        counts = {
+            'doctors': Doctor.objects.count(),
+            'patients': Patient.objects.count(),
+            'users': User.objects.count(),
+            'lab_reports': LabReport.objects.count(),
+        }
+        for date in dates:
+            appointments = Appointment.objects.filter(appointment_date=date)
+            counts[cls.daily('appointments', date)] = appointments.count()
+            counts[cls.daily('appointments_completed', date)] = appointments.filter(status='completed').count()
+            counts[cls.daily('lab_reports', date)] = LabReport.objects.filter(uploaded_at__date=date).count()
+            counts[cls.daily('active_users', date)] = User.objects.filter(last_login__date=date).count()
+
+        current = cls.values_for(counts)
+        drifted = {name: (current[name], value) for name, value in counts.items() if current[name] != value}
+        for name, value in counts.items():
+            cls.objects.update_or_create(name=name, defaults={'value': value})
+        return drifted
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class IdempotencyRecord(models.Model):
+    """First response to a POST that carried an idempotency key (see hospital/idempotency.py).
+
+    Kept in the database so every worker process sees the same keys; a row
+    without a status code is an attempt that is still running.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=64)  # sha256 of the client's key
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content = models.BinaryField(default=b'')
+    headers = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key[:12]} ({self.status_code or 'in progress'})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
@@ -0,0 +1,155 @@
+import json
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.utils.module_loading import import_string
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _refill(state, capacity, rate, now):
+    """Return the bucket's token count at `now` (state is [tokens, updated_at] or None)"""
+    if state is None:
+        return float(capacity)
+    tokens, updated_at = state
+    return min(float(capacity), tokens + (now - updated_at) * rate)
+
+
+def _consume(states, buckets, now):
+    """Take one token from every bucket or from none of them.
+
+    Returns (allowed, retry_after_seconds) and updates `states` in place.
+    """
+    levels = {key: _refill(states.get(key), capacity, rate, now) for key, capacity, rate in buckets}
+    retry_after = max(
+        ((1 - levels[key]) / rate for key, capacity, rate in buckets if levels[key] < 1),
+        default=0
+    )
+    if retry_after:
+        return False, retry_after
+
+    for key, capacity, rate in buckets:
+        states[key] = [levels[key] - 1, now]
+    return True, 0
+
+
+def _prune(states, now, stale_after):
+    """Drop buckets untouched for `stale_after` seconds; they have long refilled"""
+    for key in [key for key, state in states.items() if now - state[1] >= stale_after]:
+        del states[key]
+
+
+class InMemoryBackend:
+    """Token buckets held in this process; fine for a single server process"""
+    STALE_AFTER = 60 * 60
+    PRUNE_EVERY = 60
+
+    def __init__(self, options):
+        self._states = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.time()
+
+    def consume(self, buckets):
+        with self._lock:
+            now = time.time()
+            result = _consume(self._states, buckets, now)
+            # Sweep at most once a minute so a write is not a scan of every bucket
+            if result[0] and now - self._pruned_at >= self.PRUNE_EVERY:
+                _prune(self._states, now, self.STALE_AFTER)
+                self._pruned_at = now
+            return result
+
+
+class FileBackend:
+    """Token buckets in a JSON file shared by every worker process on the host"""
+    STALE_AFTER = 60 * 60
+
+    def __init__(self, options):
+        if fcntl is None:
+            raise ImproperlyConfigured('FileBackend needs fcntl file locking (POSIX only).')
+        self.path = str(options.get('FILE_PATH') or os.path.join(settings.BASE_DIR, 'ratelimit.json'))
+
+    def consume(self, buckets):
+        with open(self.path, 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                content = handle.read()
+                states = json.loads(content) if content else {}
+                now = time.time()
+                result = _consume(states, buckets, now)
+                if result[0]:
+                    # Pruning on every write keeps the file small
+                    _prune(states, now, self.STALE_AFTER)
+                    handle.seek(0)
+                    handle.truncate()
+                    json.dump(states, handle)
+                return result
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                options = getattr(settings, 'RATE_LIMITS', {})
+                backend_class = import_string(options.get('BACKEND', 'hospital.ratelimit.InMemoryBackend'))
+                _backend = backend_class(options)
+    return _backend
+
+
+def rate_limited(scope, key_functions):
+    """Token-bucket admission control for POSTs to a view.
+
+    `key_functions` maps a limit name in settings.RATE_LIMITS[scope] (for example
+    'user', 'doctor' or 'global') to a callable (request, **view_kwargs) -> key.
+    Each limit is configured as (requests, seconds). Over-budget requests never
+    reach the database: AJAX callers get an immediate 429, browsers are sent back
+    to the page with an error message. Both carry a Retry-After header.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            limits = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+            if request.method != 'POST' or not limits:
+                return view_func(request, *args, **kwargs)
+
+            buckets = []
+            for name, (requests, seconds) in limits.items():
+                key = key_functions[name](request, **kwargs)
+                buckets.append((f"{scope}:{name}:{key}", requests, requests / seconds))
+
+            allowed, retry_after = get_backend().consume(buckets)
+            if not allowed:
+                retry_after = math.ceil(retry_after)
+                message = f"Too many requests right now. Please try again in {retry_after} seconds."
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    response = HttpResponse(message, status=429, content_type='text/plain')
+                else:
+                    messages.error(request, message)
+                    response = redirect(request.get_full_path())
+                response['Retry-After'] = str(retry_after)
+                return response
+
+            return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
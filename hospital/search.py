@@ -0,0 +1,226 @@
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.utils import DatabaseError
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Full-text search over SQLite FTS5 virtual tables. Each index stores one row per
+# source object (rowid = primary key) and is kept current by the receivers in
+# hospital/signals.py. On other database backends, or where FTS5 is missing,
+# searches fall back to icontains filters.
+
+# Control characters mark snippet highlights so the text can be escaped before <mark> goes in
+_HIGHLIGHT_START, _HIGHLIGHT_END = '\x02', '\x03'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    return connection.vendor == 'sqlite' and _fts5_module_loaded(connection.alias)
+
+
+@lru_cache(maxsize=None)
+def _fts5_module_loaded(alias):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'")
+            return cursor.fetchone() is not None
+    except DatabaseError:
+        return False
+
+
+def tokenize_terms(text, max_length=64):
+    """Distinct lowercase words of `text`, for the plain-table inverted indexes"""
+    return {term[:max_length] for term in _TERM_RE.findall(text.lower()) if len(term) > 1}
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match, each as a prefix"""
+    terms = _TERM_RE.findall(query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class FTSIndex:
+    def __init__(self, table, columns, weights, key, source, fallback_lookups):
+        self.table = table
+        self.columns = list(columns)  # {index column: SQL expression over `source`}
+        self.expressions = list(columns.values())
+        self.weights = weights
+        self.key = key  # SQL expression for the rowid
+        self.source = source  # FROM ... JOIN ... clause the expressions refer to
+        self.fallback_lookups = fallback_lookups
+
+    def create_sql(self):
+        # prefix='2 3' keeps short type-ahead prefixes off the full term scan
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def _insert_sql(self, where=''):
+        return (
+            f"INSERT INTO {self.table}(rowid, {', '.join(self.columns)}) "
+            f"SELECT {self.key}, {', '.join(self.expressions)} {self.source} {where}"
+        )
+
+    def rebuild(self):
+        """Repopulate the whole index from the source tables; returns the row count"""
+        with connection.cursor() as cursor:
+            cursor.execute(self.create_sql())
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(self._insert_sql())
+            cursor.execute(f"SELECT count(*) FROM {self.table}")
+            return cursor.fetchone()[0]
+
+    def refresh(self, where, params):
+        """Re-index the source rows matching `where` (SQL over the source aliases)"""
+        if not fts_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN (SELECT {self.key} {self.source} WHERE {where})", params
+            )
+            cursor.execute(self._insert_sql(f"WHERE {where}"), params)
+
+    def update(self, *ids):
+        if ids:
+            self.refresh(f"{self.key} IN ({', '.join(['%s'] * len(ids))})", ids)
+
+    def remove(self, *ids):
+        if not ids or not fts_available():
+            return
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", ids)
+
+    def _fallback(self, queryset, query):
+        condition = Q()
+        for lookup in self.fallback_lookups:
+            condition |= Q(**{f'{lookup}__icontains': query})
+        return queryset.filter(condition)
+
+    def matching(self, queryset, query):
+        """Filter `queryset` to every match for `query` (unranked, no limit)"""
+        if not query.strip():
+            return queryset
+        if not fts_available() or not match_expression(query):
+            return self._fallback(queryset, query)
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match_expression(query)]
+        ))
+
+    def ranked(self, queryset, query, snippet_length=16):
+        """Ranked matches within `queryset` as a lazily paged sequence (for Paginator)"""
+        return RankedResults(self, queryset, query, snippet_length)
+
+
+def highlight(snippet):
+    """Escape an FTS5 snippet and turn its highlight markers into <mark> tags"""
+    return mark_safe(
+        escape(snippet).replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+    )
+
+
+class RankedResults:
+    """Sequence of model instances in bm25 order, fetched one slice at a time.
+
+    Each instance gets a `search_snippet` with the best-matching passage.
+    Only rows that are also in `queryset` are returned, so other filters apply.
+    """
+
+    def __init__(self, index, queryset, query, snippet_length):
+        self.index = index
+        self.queryset = queryset
+        self.expression = match_expression(query)
+        self.snippet_length = snippet_length
+        self._count = None
+
+    def _where(self):
+        subquery, params = self.queryset.order_by().values('pk').query.sql_with_params()
+        table = self.index.table
+        return f"WHERE {table} MATCH %s AND rowid IN ({subquery})", [self.expression, *params]
+
+    def count(self):
+        if self._count is None:
+            if not self.expression:
+                self._count = 0
+            else:
+                where, params = self._where()
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT count(*) FROM {self.index.table} {where}", params)
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop if item.stop is not None else self.count()
+        if not self.expression or stop <= start:
+            return []
+
+        table = self.index.table
+        weights = ', '.join(str(weight) for weight in self.index.weights)
+        where, params = self._where()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({table}, -1, %s, %s, '…', %s) FROM {table} {where} "
+                f"ORDER BY bm25({table}, {weights}) LIMIT %s OFFSET %s",
+                [_HIGHLIGHT_START, _HIGHLIGHT_END, self.snippet_length, *params, stop - start, start],
+            )
+            ranked = cursor.fetchall()
+
+        objects = self.queryset.in_bulk([pk for pk, snippet in ranked])
+        results = []
+        for pk, snippet in ranked:
+            if pk in objects:
+                objects[pk].search_snippet = highlight(snippet)
+                results.append(objects[pk])
+        return results
+
+
+patient_index = FTSIndex(
+    table='hospital_patient_search',
+    columns={
+        'first_name': 'u.first_name',
+        'last_name': 'u.last_name',
+        'username': 'u.username',
+        'email': 'u.email',
+        'phone': 'u.phone',
+    },
+    weights=[10.0, 10.0, 5.0, 2.0, 2.0],
+    key='p.id',
+    source='FROM hospital_patient p JOIN auth_user u ON u.id = p.user_id',
+    fallback_lookups=['user__first_name', 'user__last_name', 'user__username', 'user__email', 'user__phone'],
+)
+
+lab_report_index = FTSIndex(
+    table='hospital_labreport_search',
+    columns={
+        'test_name': 'l.test_name',
+        'findings': 'l.findings',
+        'notes': 'l.notes',
+        'patient_name': "pu.first_name || ' ' || pu.last_name",
+        'doctor_name': "du.first_name || ' ' || du.last_name",
+    },
+    weights=[8.0, 4.0, 2.0, 6.0, 3.0],
+    key='l.id',
+    source=(
+        'FROM hospital_labreport l '
+        'JOIN hospital_appointment a ON a.id = l.appointment_id '
+        'JOIN auth_user pu ON pu.id = a.patient_id '
+        'JOIN hospital_doctor d ON d.id = l.doctor_id '
+        'JOIN auth_user du ON du.id = d.user_id'
+    ),
+    fallback_lookups=[
+        'test_name', 'findings', 'notes',
+        'appointment__patient__first_name', 'appointment__patient__last_name',
+        'doctor__user__first_name', 'doctor__user__last_name',
+    ],
+)
@@ -0,0 +1,261 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from django.utils import timezone
+
+from hospital.events import get_event_bus, queue_channel
+
+# Sent by Appointment.compact_queue(), whose bulk_update bypasses post_save
+queue_resequenced = Signal()
+
+STATUS_EVENTS = {
+    'scheduled': 'reverted',
+    'completed': 'completed',
+    'cancelled': 'cancelled',
+}
+
+
+def publish_queue_event(doctor_id, appointment_date, event_type, appointment_ids):
+    """Publish a doctor-queue event once the current transaction commits"""
+    channel = queue_channel(doctor_id, appointment_date)
+    event = {'type': event_type, 'appointments': list(appointment_ids)}
+    transaction.on_commit(lambda: get_event_bus().publish(channel, event))
+
+
+@receiver(post_save, sender='hospital.Appointment')
+def appointment_saved(sender, instance, created, **kwargs):
+    if created:
+        event_type = 'booked'
+    elif getattr(instance, '_loaded_status', instance.status) != instance.status:
+        event_type = STATUS_EVENTS.get(instance.status, 'updated')
+    else:
+        event_type = 'updated'
+    # save() updates the stored day after post_save, so a moved appointment still reports the old one
+    stored_day = instance.stored_day
+    if stored_day != (instance.doctor_id, instance.appointment_date):
+        publish_queue_event(*stored_day, 'removed', [instance.id])
+        event_type = 'booked'
+    publish_queue_event(instance.doctor_id, instance.appointment_date, event_type, [instance.id])
+
+
+@receiver(post_delete, sender='hospital.Appointment')
+def appointment_deleted(sender, instance, **kwargs):
+    publish_queue_event(instance.doctor_id, instance.appointment_date, 'removed', [instance.id])
+
+
+@receiver(post_delete, sender='hospital.Appointment')
+def appointment_released(sender, instance, **kwargs):
+    # A receiver rather than Appointment.delete() so queryset and cascade deletes free the slot too
+    instance.release_counters()
+
+
+@receiver(queue_resequenced)
+def queue_compacted(sender, doctor_id, appointment_date, appointment_ids, **kwargs):
+    publish_queue_event(doctor_id, appointment_date, 'resequenced', appointment_ids)
+
+
+@receiver(post_save, sender='hospital.Prescription')
+def prescription_saved(sender, instance, **kwargs):
+    appointment = instance.appointment
+    publish_queue_event(appointment.doctor_id, appointment.appointment_date, 'prescription_saved', [appointment.id])
+
+
+# Dashboard counters -------------------------------------------------------
+
+MEMBER_COUNTERS = {
+    'User': 'users',
+    'Patient': 'patients',
+    'Doctor': 'doctors',
+}
+
+def bump_counter(name, delta=1):
+    from hospital.models import DashboardCounter
+    DashboardCounter.bump(name, delta)
+
+
+def daily_counter(name, date):
+    from hospital.models import DashboardCounter
+    return DashboardCounter.daily(name, date)
+
+
+@receiver(post_save, sender='hospital.User')
+@receiver(post_save, sender='hospital.Patient')
+@receiver(post_save, sender='hospital.Doctor')
+def member_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_counter(MEMBER_COUNTERS[sender.__name__])
+
+
+@receiver(post_delete, sender='hospital.User')
+@receiver(post_delete, sender='hospital.Patient')
+@receiver(post_delete, sender='hospital.Doctor')
+def member_deleted(sender, instance, **kwargs):
+    bump_counter(MEMBER_COUNTERS[sender.__name__], -1)
+
+
+@receiver(user_logged_in)
+def user_logged_in_today(sender, request, user, **kwargs):
+    # auth's own receiver has already stamped last_login; compare with the value loaded before it
+    previous = getattr(user, '_loaded_last_login', None)
+    today = timezone.localdate()
+    if previous is None or timezone.localdate(previous) != today:
+        bump_counter(daily_counter('active_users', today))
+        user._loaded_last_login = user.last_login
+
+
+@receiver(post_save, sender='hospital.Appointment')
+def appointment_counted(sender, instance, created, **kwargs):
+    date = instance.appointment_date
+    if created:
+        bump_counter(daily_counter('appointments', date))
+        if instance.status == 'completed':
+            bump_counter(daily_counter('appointments_completed', date))
+        return
+
+    old_status = getattr(instance, '_loaded_status', instance.status)
+    if old_status != instance.status and 'completed' in (old_status, instance.status):
+        bump_counter(daily_counter('appointments_completed', date), 1 if instance.status == 'completed' else -1)
+
+
+@receiver(post_delete, sender='hospital.Appointment')
+def appointment_uncounted(sender, instance, **kwargs):
+    date = instance.appointment_date
+    bump_counter(daily_counter('appointments', date), -1)
+    if getattr(instance, '_loaded_status', instance.status) == 'completed':
+        bump_counter(daily_counter('appointments_completed', date), -1)
+
+
+@receiver(post_save, sender='hospital.LabReport')
+@receiver(post_delete, sender='hospital.LabReport')
+def lab_report_changed(sender, instance, **kwargs):
+    from hospital.analytics import invalidate_lab_report_statistics
+    transaction.on_commit(invalidate_lab_report_statistics)
+
+
+@receiver(post_save, sender='hospital.LabReport')
+def lab_report_counted(sender, instance, created, **kwargs):
+    if created:
+        bump_counter('lab_reports')
+        bump_counter(daily_counter('lab_reports', timezone.localdate(instance.uploaded_at)))
+
+
+@receiver(post_delete, sender='hospital.LabReport')
+def lab_report_uncounted(sender, instance, **kwargs):
+    bump_counter('lab_reports', -1)
+    bump_counter(daily_counter('lab_reports', timezone.localdate(instance.uploaded_at)), -1)
+
+
+@receiver(post_delete, sender='hospital.Appointment')
+@receiver(post_delete, sender='hospital.LabReport')
+def snapshot_row_deleted(sender, instance, **kwargs):
+    # Recorded after the commit so a refresh cannot rebuild before the row is gone
+    from hospital.snapshots import record_snapshot_deletion
+    transaction.on_commit(lambda: record_snapshot_deletion(sender))
+
+
+# Search indexes -------------------------------------------------------------
+
+PATIENT_SEARCH_FIELDS = {'first_name', 'last_name', 'username', 'email', 'phone'}
+
+
+@receiver(post_save, sender='hospital.User')
+def user_search_fields_saved(sender, instance, created, update_fields=None, **kwargs):
+    # New users get indexed when their Patient row is created
+    if created or (update_fields is not None and not PATIENT_SEARCH_FIELDS & set(update_fields)):
+        return
+    from hospital.search import lab_report_index, patient_index
+    if instance.user_type == 'patient':
+        patient_index.refresh('u.id = %s', [instance.pk])
+        lab_report_index.refresh('a.patient_id = %s', [instance.pk])
+    elif instance.user_type == 'doctor':
+        lab_report_index.refresh('d.user_id = %s', [instance.pk])
+
+
+@receiver(post_save, sender='hospital.Patient')
+def patient_search_saved(sender, instance, **kwargs):
+    from hospital.search import patient_index
+    patient_index.update(instance.pk)
+
+
+@receiver(post_delete, sender='hospital.Patient')
+def patient_search_deleted(sender, instance, **kwargs):
+    from hospital.search import patient_index
+    patient_index.remove(instance.pk)
+
+
+@receiver(post_save, sender='hospital.LabReport')
+def lab_report_search_saved(sender, instance, **kwargs):
+    from hospital.search import lab_report_index
+    lab_report_index.update(instance.pk)
+
+
+@receiver(post_delete, sender='hospital.LabReport')
+def lab_report_search_deleted(sender, instance, **kwargs):
+    from hospital.search import lab_report_index
+    lab_report_index.remove(instance.pk)
+
+
+# User fields shown in the public doctor directory
+DIRECTORY_USER_FIELDS = {'first_name', 'last_name', 'email', 'phone', 'profile_image'}
+
+
+@receiver(post_save, sender='hospital.Doctor')
+@receiver(post_delete, sender='hospital.Doctor')
+def doctor_directory_changed(sender, instance, **kwargs):
+    from hospital.directory import invalidate_doctor_directory
+    invalidate_doctor_directory()
+
+
+@receiver(post_save, sender='hospital.Doctor')
+def doctor_availability_changed(sender, instance, **kwargs):
+    # Working days, hours and capacity all shape the cached calendars
+    from hospital.availability import invalidate_doctor_availability
+    doctor_id = instance.pk
+    transaction.on_commit(lambda: invalidate_doctor_availability(doctor_id))
+
+
+@receiver(post_save, sender='hospital.User')
+def doctor_user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # A new doctor user shows up once its Doctor row is saved; logins only touch last_login
+    if created or instance.user_type != 'doctor':
+        return
+    if update_fields is not None and not DIRECTORY_USER_FIELDS & set(update_fields):
+        return
+    from hospital.directory import invalidate_doctor_directory
+    invalidate_doctor_directory()
+
+
+@receiver(post_save, sender='hospital.Appointment')
+def appointment_token_saved(sender, instance, **kwargs):
+    from hospital.tokens import discard_token_pdfs, schedule_token_pdfs
+    if instance.status == 'cancelled':
+        # Nobody needs the token any more; don't leave the patient's details on disk
+        appointment_id = instance.id
+        transaction.on_commit(lambda: discard_token_pdfs(appointment_id))
+        return
+    # Pre-render the token; unchanged tokens hash to the file already on disk
+    schedule_token_pdfs([instance.id])
+
+
+@receiver(queue_resequenced)
+def appointment_tokens_resequenced(sender, appointment_ids, **kwargs):
+    from hospital.tokens import schedule_token_pdfs
+    schedule_token_pdfs(appointment_ids)
+
+
+@receiver(post_delete, sender='hospital.Appointment')
+def appointment_token_deleted(sender, instance, **kwargs):
+    from hospital.tokens import discard_token_pdfs
+    appointment_id = instance.id
+    transaction.on_commit(lambda: discard_token_pdfs(appointment_id))
+
+
+@receiver(post_save, sender='hospital.User')
+def profile_image_saved(sender, instance, **kwargs):
+    # Variants record the upload they were made from; a new or removed upload needs a new set
+    source = instance.profile_image.name if instance.profile_image else ''
+    if (instance.profile_image_variants or {}).get('source', '') != source:
+        from hospital.images import schedule_profile_image
+        schedule_profile_image(instance.pk)
@@ -0,0 +1,383 @@
+import bisect
+import json
+import mmap
+import os
+from array import array
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from hospital.models import Appointment, LabReport
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Columnar snapshots for long-range analytics. Each snapshot is a set of typed
+# columns (array module typecodes) laid out back to back in one file and read
+# through mmap, plus a small JSON sidecar with the row count, the refresh
+# watermark and the dictionaries used to encode string columns as small ints.
+# Rows are stored in id order; a third file holds the row positions sorted by
+# day, so a date range is found by bisection (see positions_between) and only
+# the rows inside it are read.
+#
+# A refresh only fetches rows whose timestamp is at or past the watermark (less
+# a lag for transactions that committed late) and patches them in place or
+# appends them. Out-of-order rows trigger a full rebuild, and so do deletions:
+# the post_delete receivers in hospital/signals.py append a byte to the
+# snapshot's deletion log, and a refresh rebuilds when the log has grown.
+#
+# Writers hold an exclusive flock on the snapshot's lock file and readers a
+# shared one, so open() never pairs a meta file with a data file that is being
+# replaced or patched. Dashboard requests only refresh a snapshot that is older
+# than ANALYTICS_SNAPSHOT['REFRESH_INTERVAL'] (or has seen deletions); the
+# refresh_analytics_snapshots command can keep it fresh from cron instead.
+
+
+# Row positions in the day-order file
+ORDER_TYPECODE = 'i'
+
+
+class Column:
+    def __init__(self, name, typecode, source, kind='int'):
+        self.name = name
+        self.typecode = typecode
+        self.source = source
+        self.kind = kind  # 'int', 'date' (stored as ordinal), 'hour' or 'code'
+        self.itemsize = array(typecode).itemsize
+
+
+class Snapshot:
+    model = None
+    timestamp_field = None
+    columns = ()
+
+    CAPACITY_STEP = 4096
+    REFRESH_LAG = timedelta(minutes=5)
+    CHUNK_SIZE = 5000
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.data_path = os.path.join(self.directory, f'{self.name}.bin')
+        self.meta_path = os.path.join(self.directory, f'{self.name}.json')
+        self.lock_path = os.path.join(self.directory, f'{self.name}.lock')
+        self.deletions_path = os.path.join(self.directory, f'{self.name}.deleted')
+        self.order_path = os.path.join(self.directory, f'{self.name}.order')
+
+    # Layout -----------------------------------------------------------------
+
+    def _offsets(self, capacity):
+        offsets, position = {}, 0
+        for column in self.columns:
+            offsets[column.name] = position
+            position += column.itemsize * capacity
+        return offsets, position
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta):
+        temp_path = f'{self.meta_path}.tmp'
+        with open(temp_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(temp_path, self.meta_path)
+
+    @contextmanager
+    def _locked(self, shared=False):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _deletions(self):
+        try:
+            return os.path.getsize(self.deletions_path)
+        except OSError:
+            return 0
+
+    def record_deletion(self):
+        """Note that a row was deleted; the next refresh rebuilds the snapshot"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.deletions_path, 'ab') as log_file:
+            log_file.write(b'.')
+
+    # Encoding ---------------------------------------------------------------
+
+    def _encode(self, meta, column, value):
+        if column.kind == 'date':
+            if isinstance(value, datetime):
+                value = timezone.localtime(value)
+            return value.toordinal()
+        if column.kind == 'hour':
+            return value.hour if value is not None else -1
+        if column.kind == 'code':
+            values = meta['dictionaries'].setdefault(column.name, [])
+            codes = meta.setdefault('_codes', {}).setdefault(column.name, {v: i for i, v in enumerate(values)})
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+            return codes[value]
+        return value or 0
+
+    def _fetch(self, meta, since=None):
+        """Yield encoded rows (column order) changed at or after `since`"""
+        queryset = self.model.objects.all()
+        if since is not None:
+            queryset = queryset.filter(**{f'{self.timestamp_field}__gte': since})
+        sources = [column.source for column in self.columns]
+        for row in queryset.order_by('id').values_list(*sources).iterator(chunk_size=self.CHUNK_SIZE):
+            yield [self._encode(meta, column, value) for column, value in zip(self.columns, row)]
+
+    # Building ---------------------------------------------------------------
+
+    def _write_data(self, data, rows):
+        capacity = (rows // self.CAPACITY_STEP + 1) * self.CAPACITY_STEP
+        temp_path = f'{self.data_path}.tmp'
+        with open(temp_path, 'wb') as data_file:
+            for column in self.columns:
+                data[column.name].tofile(data_file)
+                data_file.write(bytes(column.itemsize * (capacity - rows)))
+        os.replace(temp_path, self.data_path)
+        return capacity
+
+    def _write_order(self, meta):
+        """Write the positions of the rows sorted by day (ties stay in id order)"""
+        with self._open(meta, order=False) as columns:
+            days = columns['day']
+            order = array(ORDER_TYPECODE, sorted(range(meta['rows']), key=days.__getitem__))
+        temp_path = f'{self.order_path}.tmp'
+        with open(temp_path, 'wb') as order_file:
+            order.tofile(order_file)
+        os.replace(temp_path, self.order_path)
+
+    def rebuild(self):
+        with self._locked():
+            return self._rebuild()
+
+    def _rebuild(self):
+        meta = {'rows': 0, 'capacity': 0, 'max_id': 0, 'dictionaries': {}, 'deletions': self._deletions()}
+        watermark = timezone.now()
+        data = {column.name: array(column.typecode) for column in self.columns}
+        for row in self._fetch(meta):
+            for column, value in zip(self.columns, row):
+                data[column.name].append(value)
+
+        rows = len(data['id'])
+        meta.update(
+            rows=rows,
+            capacity=self._write_data(data, rows),
+            max_id=data['id'][-1] if rows else 0,
+            watermark=watermark.isoformat(),
+        )
+        self._write_order(meta)
+        meta.pop('_codes', None)
+        self._write_meta(meta)
+        return rows
+
+    def _needs_rebuild(self, meta):
+        if meta is None or not os.path.exists(self.data_path) or meta.get('deletions') != self._deletions():
+            return True
+        try:
+            return os.path.getsize(self.order_path) != meta['rows'] * array(ORDER_TYPECODE).itemsize
+        except OSError:
+            return True
+
+    def is_stale(self, max_age):
+        """Whether the snapshot needs a rebuild or was last refreshed over `max_age` seconds ago"""
+        meta = self._read_meta()
+        if self._needs_rebuild(meta):
+            return True
+        return (timezone.now() - datetime.fromisoformat(meta['watermark'])).total_seconds() > max_age
+
+    def refresh(self, max_age=None):
+        """Bring the snapshot up to date; returns the number of rows fetched.
+
+        With `max_age`, a snapshot refreshed within that many seconds is left as
+        it is, so requests queued behind another refresh don't repeat it.
+        """
+        with self._locked():
+            if max_age is not None and not self.is_stale(max_age):
+                return 0
+            meta = self._read_meta()
+            if self._needs_rebuild(meta):
+                return self._rebuild()
+
+            watermark = timezone.now()
+            since = datetime.fromisoformat(meta['watermark']) - self.REFRESH_LAG
+            changed = list(self._fetch(meta, since))
+            if changed:
+                if not self._apply(meta, changed):
+                    return self._rebuild()
+                self._write_order(meta)
+
+            meta['watermark'] = watermark.isoformat()
+            meta.pop('_codes', None)
+            self._write_meta(meta)
+            return len(changed)
+
+    def _apply(self, meta, changed):
+        """Patch changed rows in place and append new ones; False if a rebuild is needed"""
+        rows, max_id = meta['rows'], meta['max_id']
+        appended = [row for row in changed if row[0] > max_id]
+        updated = [row for row in changed if row[0] <= max_id]
+
+        if rows + len(appended) > meta['capacity']:
+            with self._open(order=False) as snapshot:
+                data = {}
+                for column in self.columns:
+                    data[column.name] = array(column.typecode)
+                    data[column.name].frombytes(snapshot[column.name].tobytes())
+            for row in appended:
+                for column, value in zip(self.columns, row):
+                    data[column.name].append(value)
+            positions = self._positions(data['id'], rows, updated)
+            if positions is None:
+                return False
+            for position, row in positions:
+                for column, value in zip(self.columns, row):
+                    data[column.name][position] = value
+            meta['capacity'] = self._write_data(data, rows + len(appended))
+        else:
+            offsets, size = self._offsets(meta['capacity'])
+            with open(self.data_path, 'r+b') as data_file, mmap.mmap(data_file.fileno(), size) as mapped:
+                ids = memoryview(mapped)[offsets['id']:offsets['id'] + rows * 8].cast('q')
+                positions = self._positions(ids, rows, updated)
+                ids.release()
+                if positions is None:
+                    return False
+                positions += [(rows + index, row) for index, row in enumerate(appended)]
+                for index, column in enumerate(self.columns):
+                    view = memoryview(mapped)[offsets[column.name]:offsets[column.name] + size].cast(column.typecode)
+                    for position, row in positions:
+                        view[position] = row[index]
+                    view.release()
+                mapped.flush()
+
+        meta['rows'] = rows + len(appended)
+        if appended:
+            meta['max_id'] = appended[-1][0]
+        return True
+
+    @staticmethod
+    def _positions(ids, rows, updated):
+        positions = []
+        for row in updated:
+            position = bisect.bisect_left(ids, row[0], 0, rows)
+            if position == rows or ids[position] != row[0]:
+                return None  # committed after a newer row was already snapshotted
+            positions.append((position, row))
+        return positions
+
+    # Reading ----------------------------------------------------------------
+
+    @contextmanager
+    def open(self):
+        """Map the snapshot read-only; yields {column name: typed memoryview, ...}"""
+        with self._locked(shared=True), self._open() as snapshot:
+            yield snapshot
+
+    @contextmanager
+    def _open(self, meta=None, order=True):
+        meta = meta or self._read_meta()
+        rows = meta['rows']
+        offsets, size = self._offsets(meta['capacity'])
+        with ExitStack() as stack:
+            data_file = stack.enter_context(open(self.data_path, 'rb'))
+            mapped = stack.enter_context(mmap.mmap(data_file.fileno(), size, access=mmap.ACCESS_READ))
+            views = {
+                column.name: memoryview(mapped)[offsets[column.name]:offsets[column.name] + size].cast(column.typecode)[:rows]
+                for column in self.columns
+            }
+            if order:
+                if rows:
+                    order_file = stack.enter_context(open(self.order_path, 'rb'))
+                    order_size = rows * array(ORDER_TYPECODE).itemsize
+                    mapped_order = stack.enter_context(mmap.mmap(order_file.fileno(), order_size, access=mmap.ACCESS_READ))
+                    views['order'] = memoryview(mapped_order).cast(ORDER_TYPECODE)
+                else:
+                    views['order'] = memoryview(array(ORDER_TYPECODE))
+            try:
+                yield {'dictionaries': meta['dictionaries'], **views}
+            finally:
+                for view in views.values():
+                    view.release()
+
+    @staticmethod
+    def positions_between(columns, first_day, last_day):
+        """Positions of the rows with first_day <= day <= last_day, found by bisecting the day order"""
+        order, days = columns['order'], columns['day']
+        start = bisect.bisect_left(order, first_day, key=days.__getitem__)
+        stop = bisect.bisect_right(order, last_day, lo=start, key=days.__getitem__)
+        return order[start:stop].tolist()
+
+    @staticmethod
+    def rows_at(columns, names, positions):
+        """Tuples of the named columns for each of `positions`"""
+        return zip(*(map(columns[name].__getitem__, positions) for name in names))
+
+
+class AppointmentSnapshot(Snapshot):
+    name = 'appointments'
+    model = Appointment
+    timestamp_field = 'updated_at'
+    # Wider columns first keeps every column aligned in the mapped file
+    columns = (
+        Column('id', 'q', 'id'),
+        Column('day', 'i', 'appointment_date', 'date'),
+        Column('doctor', 'i', 'doctor_id'),
+        Column('status', 'b', 'status', 'code'),
+        Column('hour', 'b', 'estimated_time', 'hour'),
+        Column('specialization', 'b', 'doctor__specialization', 'code'),
+    )
+
+
+class LabReportSnapshot(Snapshot):
+    name = 'lab_reports'
+    model = LabReport
+    timestamp_field = 'updated_at'
+    columns = (
+        Column('id', 'q', 'id'),
+        Column('day', 'i', 'uploaded_at', 'date'),
+        Column('doctor', 'i', 'doctor_id'),
+        Column('patient', 'i', 'appointment__patient_id'),
+        Column('test_name', 'i', 'test_name', 'code'),
+        Column('report_type', 'b', 'report_type', 'code'),
+    )
+
+
+DEFAULT_REFRESH_INTERVAL = 5 * 60
+
+
+def snapshot_directory():
+    return getattr(settings, 'ANALYTICS_SNAPSHOT', {}).get(
+        'DIRECTORY', os.path.join(settings.BASE_DIR, 'var', 'snapshots')
+    )
+
+
+def record_snapshot_deletion(model):
+    """Mark the snapshots built from `model` for a rebuild"""
+    for snapshot_class in (AppointmentSnapshot, LabReportSnapshot):
+        if snapshot_class.model is model:
+            snapshot_class(snapshot_directory()).record_deletion()
+
+
+def get_snapshot(snapshot_class):
+    """A snapshot at most REFRESH_INTERVAL seconds old; callers read it with `with snapshot.open() as columns`"""
+    snapshot = snapshot_class(snapshot_directory())
+    max_age = getattr(settings, 'ANALYTICS_SNAPSHOT', {}).get('REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)
+    # The check reads the meta file without a lock; only a stale snapshot takes the exclusive one
+    if snapshot.is_stale(max_age):
+        snapshot.refresh(max_age)
+    return snapshot
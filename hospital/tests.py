@@ -1,3 +1,309 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from hospital.events import InProcessEventBus, queue_channel
+from hospital.idempotency import _digest
+from hospital.models import Appointment, DailyQueue, Doctor, DoctorFullyBooked, IdempotencyRecord, Patient, User, WaitlistEntry
+
+ALL_WEEK = 'monday,tuesday,wednesday,thursday,friday,saturday,sunday'
+
+
+def make_doctor(max_appointments=2):
+    user = User.objects.create_user('doctor', password='pw', user_type='doctor', first_name='Ann', last_name='Lee')
+    return Doctor.objects.create(
+        user=user, available_days=ALL_WEEK, max_appointments=max_appointments,
+        start_time=time(9, 0), end_time=time(17, 0),
+    )
+
+
+def make_patient(username):
+    return User.objects.create_user(username, password='pw', user_type='patient')
+
+
+@override_settings(RATE_LIMITS={})
+class BookingCapacityTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor(max_appointments=2)
+        self.day = timezone.now().date() + timedelta(days=3)
+
+    def book(self, patient):
+        self.client.force_login(patient)
+        return self.client.post(
+            reverse('make_appointment', args=[self.doctor.id]),
+            {'appointment_date': self.day.isoformat(), 'reason': 'checkup'},
+        )
+
+    def test_tokens_are_allocated_in_order(self):
+        for username in ('p1', 'p2'):
+            self.book(make_patient(username))
+        tokens = list(Appointment.objects.order_by('id').values_list('token_number', 'estimated_time'))
+        self.assertEqual(tokens, [(1, time(9, 0)), (2, time(9, 10))])
+
+    def test_booking_past_capacity_is_refused(self):
+        for username in ('p1', 'p2'):
+            self.book(make_patient(username))
+
+        response = self.book(make_patient('p3'))
+        self.assertRedirects(response, reverse('make_appointment', args=[self.doctor.id]), fetch_redirect_response=False)
+        self.assertEqual(Appointment.objects.count(), 2)
+        with self.assertRaises(DoctorFullyBooked):
+            DailyQueue.reserve_token(self.doctor.id, self.day, self.doctor.max_appointments)
+
+        queue = DailyQueue.objects.get(doctor=self.doctor, appointment_date=self.day)
+        self.assertEqual((queue.last_token, queue.scheduled_count), (2, 2))
+
+    def test_cancelling_frees_capacity_for_a_new_booking(self):
+        first, second, third = make_patient('p1'), make_patient('p2'), make_patient('p3')
+        self.book(first)
+        self.book(second)
+
+        Appointment.objects.get(patient=first).cancel()
+        self.book(third)
+
+        rebooked = Appointment.objects.get(patient=third)
+        self.assertEqual(rebooked.status, 'scheduled')
+        # Tokens keep counting up; the freed slot is capacity, not a reused number
+        self.assertEqual(rebooked.token_number, 3)
+
+        queue = DailyQueue.objects.get(doctor=self.doctor, appointment_date=self.day)
+        self.assertEqual((queue.scheduled_count, queue.last_token), (2, 3))
+        self.assertEqual(self.book(make_patient('p4')).status_code, 302)
+        self.assertEqual(Appointment.objects.exclude(status='cancelled').count(), 2)
+
+    def test_explicit_token_moves_the_queue_and_respects_capacity(self):
+        Appointment.objects.create(
+            patient=make_patient('p1'), doctor=self.doctor, appointment_date=self.day, token_number=5,
+        )
+        queue = DailyQueue.objects.get(doctor=self.doctor, appointment_date=self.day)
+        self.assertEqual((queue.last_token, queue.scheduled_count), (5, 1))
+
+        self.book(make_patient('p2'))
+        self.assertEqual(Appointment.objects.get(patient__username='p2').token_number, 6)
+
+        with self.assertRaises(DoctorFullyBooked):
+            Appointment.objects.create(
+                patient=make_patient('p3'), doctor=self.doctor, appointment_date=self.day, token_number=9,
+            )
+
+    def test_moving_an_appointment_moves_its_slot(self):
+        self.book(make_patient('p1'))
+        self.book(make_patient('p2'))
+        later = self.day + timedelta(days=1)
+
+        appointment = Appointment.objects.get(patient__username='p1')
+        appointment.appointment_date = later
+        appointment.save()
+
+        queues = DailyQueue.objects.filter(doctor=self.doctor)
+        self.assertEqual(queues.get(appointment_date=self.day).scheduled_count, 1)
+        moved = queues.get(appointment_date=later)
+        self.assertEqual((moved.scheduled_count, moved.last_token), (1, 1))
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.token_number, appointment.estimated_time), (1, time(9, 0)))
+
+    def test_queryset_delete_frees_the_slot(self):
+        self.book(make_patient('p1'))
+        self.book(make_patient('p2'))
+        Appointment.objects.filter(patient__username='p1').delete()
+        User.objects.get(username='p2').delete()
+
+        queue = DailyQueue.objects.get(doctor=self.doctor, appointment_date=self.day)
+        self.assertEqual(queue.scheduled_count, 0)
+        # Cascades from the doctor must not recreate the rows they are deleting
+        self.book(make_patient('p3'))
+        self.doctor.delete()
+        self.assertFalse(DailyQueue.objects.exists())
+
+
+@override_settings(RATE_LIMITS={})
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor(max_appointments=1)
+        self.day = timezone.now().date() + timedelta(days=3)
+
+    def join(self, patient):
+        self.client.force_login(patient)
+        return self.client.post(
+            reverse('join_waitlist', args=[self.doctor.id]),
+            {'appointment_date': self.day.isoformat(), 'reason': 'checkup'},
+        )
+
+    def test_joining_with_free_capacity_sends_patient_to_booking(self):
+        response = self.join(make_patient('p1'))
+        self.assertRedirects(response, reverse('make_appointment', args=[self.doctor.id]), fetch_redirect_response=False)
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_promotion_skips_patients_already_booked(self):
+        first, second, third = make_patient('p1'), make_patient('p2'), make_patient('p3')
+        booked = Appointment.objects.create(patient=first, doctor=self.doctor, appointment_date=self.day)
+        self.join(second)
+        self.join(third)
+        self.assertEqual(WaitlistEntry.objects.filter(status='waiting').count(), 2)
+
+        # The doctor took on one more patient and p2 booked that slot directly
+        Doctor.objects.filter(pk=self.doctor.pk).update(max_appointments=2)
+        self.doctor.refresh_from_db()
+        Appointment.objects.create(patient=second, doctor=self.doctor, appointment_date=self.day)
+
+        Appointment.objects.get(pk=booked.pk).cancel()
+
+        self.assertEqual(WaitlistEntry.objects.get(patient=second).status, 'left')
+        promoted = WaitlistEntry.objects.get(patient=third)
+        self.assertEqual(promoted.status, 'promoted')
+        self.assertEqual(Appointment.objects.filter(patient=second).count(), 1)
+
+
+class AdminPatientSearchTests(TestCase):
+    def test_total_counts_every_match_across_pages(self):
+        for number in range(205):
+            user = User.objects.create(username=f'smith{number}', last_name='Smith', user_type='patient')
+            Patient.objects.create(user=user, date_of_birth=date(1990, 1, 1), address='-', emergency_contact='-')
+        admin = User.objects.create_user('admin', password='pw', user_type='admin')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('admin_patients_list'), {'search': 'smith', 'page': 9})
+        self.assertEqual(response.context['total_patients'], 205)
+        self.assertEqual(len(response.context['patients']), 5)  # the last page of 25
+
+
+class RenumberDuplicateTokensMigrationTests(TestCase):
+    def test_cancelled_duplicate_moves_and_gets_a_matching_time(self):
+        doctor = make_doctor()
+        day = date(2025, 10, 20)
+        cancelled = Appointment(
+            patient=make_patient('p1'), doctor=doctor, appointment_date=day,
+            token_number=1, estimated_time=time(9, 0), status='cancelled',
+        )
+        completed = Appointment(
+            patient=make_patient('p2'), doctor=doctor, appointment_date=day,
+            token_number=1, estimated_time=time(9, 0), status='completed',
+        )
+        # Inserted in this order so the cancelled row has the lower id, as in the shipped data
+        Appointment.objects.bulk_create([cancelled])
+        Appointment.objects.bulk_create([completed])
+
+        migration = import_module('hospital.migrations.0012_dailyqueue')
+        apps = MigrationLoader(connection).project_state(('hospital', '0012_dailyqueue')).apps
+        migration.renumber_duplicate_tokens(apps, None)
+
+        cancelled.refresh_from_db()
+        completed.refresh_from_db()
+        self.assertEqual((completed.token_number, completed.estimated_time), (1, time(9, 0)))
+        self.assertEqual((cancelled.token_number, cancelled.estimated_time), (2, time(9, 10)))
+
+
+@override_settings(RATE_LIMITS={})
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.day = timezone.now().date() + timedelta(days=3)
+        self.patient = make_patient('p1')
+        self.client.force_login(self.patient)
+
+    def book(self, key, day=None):
+        return self.client.post(
+            reverse('make_appointment', args=[self.doctor.id]),
+            {'appointment_date': (day or self.day).isoformat(), 'reason': 'checkup', 'idempotency_key': key},
+        )
+
+    def test_repeated_key_replays_the_first_response(self):
+        first = self.book('key-1')
+        second = self.book('key-1')
+
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replay'], 'true')
+        self.assertNotIn('Idempotent-Replay', self.book('key-2'))
+
+    def test_failed_attempt_is_not_replayed(self):
+        past = timezone.now().date() - timedelta(days=1)
+        self.book('key-1', day=past)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        self.book('key-1')
+        self.assertEqual(Appointment.objects.filter(patient=self.patient).count(), 1)
+
+    def test_duplicate_of_a_running_attempt_is_told_to_retry(self):
+        IdempotencyRecord.objects.create(user=self.patient, key=_digest('key-1'))
+
+        response = self.book('key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(Appointment.objects.exists())
+
+
+@override_settings(RATE_LIMITS={'booking': {'user': (1, 60)}})
+class BookingRateLimitTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor(max_appointments=5)
+        self.day = timezone.now().date() + timedelta(days=3)
+        self.client.force_login(make_patient('p1'))
+        # A fresh in-memory backend, so buckets do not carry over between tests
+        patcher = mock.patch('hospital.ratelimit._backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book(self, **headers):
+        return self.client.post(
+            reverse('make_appointment', args=[self.doctor.id]),
+            {'appointment_date': self.day.isoformat(), 'reason': 'checkup'},
+            headers=headers,
+        )
+
+    def test_over_budget_form_post_is_sent_back_with_a_message(self):
+        self.book()
+        response = self.book()
+
+        self.assertRedirects(response, reverse('make_appointment', args=[self.doctor.id]), fetch_redirect_response=False)
+        self.assertIn('Retry-After', response)
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertTrue(any(message.startswith('Too many requests') for message in messages))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_over_budget_ajax_post_gets_429(self):
+        self.book()
+        response = self.book(X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class QueueStreamTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.day = timezone.now().date()
+        self.bus = InProcessEventBus({})
+        for patcher in (
+            mock.patch('hospital.events._event_bus', self.bus),
+            mock.patch('hospital.views.QUEUE_STREAM_DURATION', 0.2),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.force_login(self.doctor.user)
+
+    def test_reconnect_replays_events_after_last_event_id(self):
+        first, second = (
+            Appointment.objects.create(patient=make_patient(username), doctor=self.doctor, appointment_date=self.day)
+            for username in ('p1', 'p2')
+        )
+        channel = queue_channel(self.doctor.id, self.day)
+        self.bus.publish(channel, {'type': 'booked', 'appointments': [first.id]})
+        self.bus.publish(channel, {'type': 'booked', 'appointments': [second.id]})
+
+        response = self.client.get(
+            reverse('doctor_queue_stream'), {'date': self.day.isoformat()}, headers={'Last-Event-ID': '1'},
+        )
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertNotIn('id: 1\n', body)
+        self.assertIn('id: 2\n', body)
+        self.assertIn(f'appointment-row-{second.id}', body)
@@ -0,0 +1,322 @@
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from hospital.utils import get_qr_cache, qr_code_key, qr_code_png, render_qr_code_png
+
+logger = logging.getLogger(__name__)
+
+# Appointment token PDFs. Rendering is split in two: token_page_data() turns an
+# appointment into plain strings (including the QR text), and draw_token_page()
+# lays one page out on a ReportLab canvas. Single tokens are cached on disk under a hash
+# of everything printed on them (see token_pdf_path), so a changed token number,
+# time or status simply maps to a new file. The files carry patient details, so
+# cancelled tokens are never kept on disk and prune_token_pdfs removes copies
+# older than TOKEN_PDF['MAX_AGE_DAYS'].
+
+# Bump when the page layout changes so cached files are re-rendered
+TOKEN_LAYOUT_VERSION = 2
+
+TOKEN_QR_OPTIONS = {'box_size': 4, 'border': 2, 'error_correction': 'M'}
+
+# Batches with fewer uncached QR codes than this encode them in-process
+BATCH_POOL_THRESHOLD = 8
+
+DEFAULT_MAX_AGE_DAYS = 7
+
+INSTRUCTIONS = [
+    "1. Arrive 15 minutes before your estimated appointment time",
+    "2. Bring this token and any relevant medical reports",
+    "3. Inform reception if you need to reschedule or cancel",
+    "4. Emergency cases will be given priority",
+    "5. Maintain silence in the waiting area"
+]
+
+
+def token_page_data(appointment):
+    """Everything printed on an appointment's token, as picklable values"""
+    qr_data = f"""
+Hospital Management System
+Appointment Token: #{appointment.token_number}
+Patient: {appointment.patient.get_full_name()}
+Doctor: Dr. {appointment.doctor.user.get_full_name()}
+Date: {appointment.appointment_date.strftime('%Y-%m-%d')}
+Time: {appointment.estimated_time.strftime('%H:%M')}
+    """.strip()
+
+    return {
+        'appointment_id': appointment.id,
+        'token_number': appointment.token_number,
+        'status': appointment.status,
+        'patient_name': appointment.patient.get_full_name(),
+        'patient_phone': str(appointment.patient.phone),
+        'patient_email': appointment.patient.email,
+        'doctor_name': appointment.doctor.user.get_full_name(),
+        'specialization': appointment.doctor.get_specialization_display(),
+        'qualification': appointment.doctor.qualification,
+        'date': appointment.appointment_date.strftime('%B %d, %Y'),
+        'time': appointment.estimated_time.strftime('%I:%M %p'),
+        'qr_data': qr_data,
+    }
+
+
+def draw_token_page(p, data, qr_png=None):
+    """Draw one token on the canvas and finish the page"""
+    width, height = A4
+
+    # Hospital Header
+    p.setFont("Helvetica-Bold", 20)
+    p.drawString(50, height - 50, "Hospital Management System")
+    p.setFont("Helvetica", 12)
+    p.drawString(50, height - 70, "Quality Healthcare, Always Available")
+
+    # Separator line
+    p.line(50, height - 80, width - 50, height - 80)
+
+    # Title
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(50, height - 110, "APPOINTMENT TOKEN")
+    if data['status'] == 'cancelled':
+        p.setFillColorRGB(0.8, 0, 0)
+        p.drawString(260, height - 110, "CANCELLED")
+        p.setFillColorRGB(0, 0, 0)
+
+    # Token Number (Big and prominent)
+    p.setFont("Helvetica-Bold", 48)
+    p.drawString(50, height - 170, f"TOKEN #{data['token_number']}")
+
+    # Appointment Details
+    y_position = height - 220
+    p.setFont("Helvetica-Bold", 12)
+
+    # Patient Details
+    p.drawString(50, y_position, "PATIENT DETAILS:")
+    p.setFont("Helvetica", 12)
+    p.drawString(50, y_position - 20, f"Name: {data['patient_name']}")
+    p.drawString(50, y_position - 35, f"Phone: {data['patient_phone']}")
+    p.drawString(50, y_position - 50, f"Email: {data['patient_email']}")
+
+    # Doctor Details
+    y_position -= 80
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y_position, "DOCTOR DETAILS:")
+    p.setFont("Helvetica", 12)
+    p.drawString(50, y_position - 20, f"Name: Dr. {data['doctor_name']}")
+    p.drawString(50, y_position - 35, f"Specialization: {data['specialization']}")
+    p.drawString(50, y_position - 50, f"Qualification: {data['qualification']}")
+
+    # Appointment Timing
+    y_position -= 80
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y_position, "APPOINTMENT TIMING:")
+    p.setFont("Helvetica", 12)
+    p.drawString(50, y_position - 20, f"Date: {data['date']}")
+    p.drawString(50, y_position - 35, f"Estimated Time: {data['time']}")
+
+    # Add QR Code to PDF (right side)
+    if qr_png is None:
+        qr_png = qr_code_png(data['qr_data'], **TOKEN_QR_OPTIONS)
+    p.drawImage(ImageReader(BytesIO(qr_png)), width - 120, height - 300, width=80, height=80)
+    p.setFont("Helvetica-Oblique", 10)
+    p.drawString(width - 120, height - 385, "Scan for details")
+
+    # Instructions
+    y_position = 200
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y_position, "IMPORTANT INSTRUCTIONS:")
+    p.setFont("Helvetica", 10)
+
+    for i, instruction in enumerate(INSTRUCTIONS):
+        p.drawString(60, y_position - 20 - (i * 15), instruction)
+
+    # Footer
+    p.setFont("Helvetica-Oblique", 10)
+    p.drawString(50, 50, "Thank you for choosing our hospital. We care for your health!")
+
+    p.showPage()
+
+
+# Disk cache -------------------------------------------------------------------
+
+def token_directory():
+    return str(getattr(settings, 'TOKEN_PDF', {}).get(
+        'DIRECTORY', os.path.join(settings.BASE_DIR, 'var', 'tokens')
+    ))
+
+
+def token_pdf_path(data):
+    """Cache path for a token: <appointment id>-<hash of the printed content>.pdf"""
+    content = repr(sorted(data.items())).encode()
+    digest = hashlib.sha256(f"{TOKEN_LAYOUT_VERSION}:".encode() + content).hexdigest()
+    return os.path.join(token_directory(), f"{data['appointment_id']}-{digest}.pdf")
+
+
+def _token_queryset():
+    from hospital.models import Appointment
+    return Appointment.objects.select_related('patient', 'doctor__user')
+
+
+def get_token_pdf(appointment):
+    """Path of the appointment's rendered token, rendering it first if the cache has no current copy"""
+    data = token_page_data(appointment)
+    path = token_pdf_path(data)
+    if not os.path.exists(path):
+        _write_token_pdf(data, path)
+    return path
+
+
+def open_token_pdf(appointment):
+    """The appointment's token as an open binary file; cancelled tokens are rendered to a temporary file"""
+    if appointment.status != 'cancelled':
+        return open(get_token_pdf(appointment), 'rb')
+    discard_token_pdfs(appointment.id)
+    output = tempfile.TemporaryFile()
+    p = canvas.Canvas(output, pagesize=A4)
+    draw_token_page(p, token_page_data(appointment))
+    p.save()
+    output.seek(0)
+    return output
+
+
+def _write_token_pdf(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    p = canvas.Canvas(temp_path, pagesize=A4)
+    draw_token_page(p, data)
+    p.save()
+    os.replace(temp_path, path)
+
+    # Earlier renders of this appointment are stale now
+    for stale_path in glob.glob(os.path.join(os.path.dirname(path), f"{data['appointment_id']}-*.pdf")):
+        if stale_path != path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+
+def discard_token_pdfs(appointment_id):
+    for path in glob.glob(os.path.join(token_directory(), f"{appointment_id}-*.pdf")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def prune_token_pdfs(days=None):
+    """Remove cached tokens (and stray temporary files) older than `days`; returns the count"""
+    if days is None:
+        days = getattr(settings, 'TOKEN_PDF', {}).get('MAX_AGE_DAYS', DEFAULT_MAX_AGE_DAYS)
+    cutoff = time.time() - timedelta(days=days).total_seconds()
+    removed = 0
+    for path in glob.glob(os.path.join(token_directory(), '*.pdf*')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# Batches ----------------------------------------------------------------------
+
+def _render_token_qr(qr_data):
+    return render_qr_code_png(qr_data, **TOKEN_QR_OPTIONS)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_size():
+    return getattr(settings, 'TOKEN_PDF', {}).get('BATCH_WORKERS') or os.cpu_count() or 1
+
+
+def _qr_pool():
+    """One process pool for the life of the worker, started on first use.
+
+    Its processes come from a fork server (or are spawned), never forked from
+    this multi-threaded web worker, where a lock held by another thread would
+    be copied into the child still held.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=_pool_size(), mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def token_qr_codes(pages):
+    """QR PNGs for many tokens; cache misses are encoded across a process pool"""
+    cache = get_qr_cache()
+    keys = [qr_code_key(data['qr_data'], **TOKEN_QR_OPTIONS) for data in pages]
+    pngs = [cache.get(key) for key in keys]
+    missing = [index for index, png in enumerate(pngs) if png is None]
+    payloads = [pages[index]['qr_data'] for index in missing]
+
+    workers = _pool_size()
+    if workers > 1 and len(missing) >= BATCH_POOL_THRESHOLD:
+        chunksize = max(len(missing) // (workers * 4), 1)
+        rendered = list(_qr_pool().map(_render_token_qr, payloads, chunksize=chunksize))
+    else:
+        rendered = [_render_token_qr(payload) for payload in payloads]
+
+    for index, png in zip(missing, rendered):
+        cache.put(keys[index], png)
+        pngs[index] = png
+    return pngs
+
+
+def render_token_batch(appointments, output):
+    """Write every appointment's token, one per page, as a single PDF to `output`
+
+    The QR encoding (the expensive part) is spread over worker processes; the
+    pages are laid out here, since one ReportLab canvas holds the document.
+    """
+    pages = [token_page_data(appointment) for appointment in appointments]
+    p = canvas.Canvas(output, pagesize=A4)
+    for data, qr_png in zip(pages, token_qr_codes(pages)):
+        draw_token_page(p, data, qr_png)
+    p.save()
+
+
+# Background rendering ---------------------------------------------------------
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-pdf')
+
+
+def _render_in_background(appointment_ids):
+    # A failure here only means the download renders the token itself, but the
+    # executor would keep the exception to itself, so log it
+    try:
+        for appointment in _token_queryset().filter(id__in=appointment_ids).exclude(status='cancelled'):
+            get_token_pdf(appointment)
+    except Exception:
+        logger.exception('Pre-rendering token PDFs failed for appointments %s', appointment_ids)
+    finally:
+        connection.close()
+
+
+def schedule_token_pdfs(appointment_ids):
+    """Render the tokens on a worker thread once the current transaction commits"""
+    if not getattr(settings, 'TOKEN_PDF', {}).get('RENDER_ON_SAVE', True):
+        return
+    appointment_ids = list(appointment_ids)
+    transaction.on_commit(lambda: _executor.submit(_render_in_background, appointment_ids))
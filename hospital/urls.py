@@ -15,15 +15,24 @@ urlpatterns = [
     path('doctor_dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('doctors/', views.view_doctors, name='view_doctors'),
+    path('doctors/suggest/', views.doctor_suggestions, name='doctor_suggestions'),
     path('doctors/book/<int:doctor_id>/', views.make_appointment, name='make_appointment'),
+    path('doctors/<int:doctor_id>/availability/', views.doctor_availability, name='doctor_availability'),
+    path('doctors/<int:doctor_id>/waitlist/', views.join_waitlist, name='join_waitlist'),
+    path('waitlist/<int:entry_id>/status/', views.waitlist_status, name='waitlist_status'),
+    path('waitlist/<int:entry_id>/leave/', views.leave_waitlist, name='leave_waitlist'),
     path('booking/success/<int:appointment_id>/', views.appointment_success, name='appointment_success'),
+    path('appointment/<int:appointment_id>/qr.png', views.appointment_qr_code, name='appointment_qr_code'),
     path('appointment/<int:appointment_id>/download-token/', views.download_appointment_token, name='download_appointment_token'),
     path('appointments/cancel/<int:appointment_id>/', views.cancel_appointment, name='cancel_appointment'),
     path('doctor/dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
+    path('doctor/queue/stream/', views.doctor_queue_stream, name='doctor_queue_stream'),
     path('appointments/complete/<int:appointment_id>/', views.complete_appointment, name='complete_appointment'),
     path('appointments/revert/<int:appointment_id>/', views.revert_appointment, name='revert_appointment'),
     path('prescriptions/add/', views.add_prescription, name='add_prescription'),
     path('prescriptions/<int:appointment_id>/', views.get_prescription, name='get_prescription'),
+    path('prescriptions/search/', views.doctor_prescription_search, name='doctor_prescription_search'),
+    path('doctor/tokens/print/', views.doctor_day_tokens, name='doctor_day_tokens'),
     path('patient_history/<int:patient_id>', views.patient_history, name='patient_history'),
     path('patient/medical-history/', views.patient_treatment_history, name='patient_treatment_history'),
     path('patient/medical-history/doctor/<int:doctor_id>/', views.patient_doctor_history, name='patient_doctor_history'),
@@ -35,6 +44,7 @@ urlpatterns = [
     path('admin/doctors/create/', views.admin_doctor_create, name='admin_doctor_create'),
     path('admin/doctors/<int:doctor_id>/', views.admin_doctor_detail, name='admin_doctor_detail'),
     path('admin/doctors/<int:doctor_id>/edit/', views.admin_doctor_edit, name='admin_doctor_edit'),
+    path('admin/doctors/<int:doctor_id>/tokens/print/', views.admin_doctor_day_tokens, name='admin_doctor_day_tokens'),
     path('admin/doctors/<int:doctor_id>/toggle-active/', views.admin_doctor_toggle_active, name='admin_doctor_toggle_active'),
     path('admin/patients/', views.admin_patients_list, name='admin_patients_list'),
     path('admin/patients/<int:patient_id>/', views.admin_patient_detail, name='admin_patient_detail'),
@@ -42,10 +52,13 @@ urlpatterns = [
 
     # Admin Appointments
     path('admin/appointments/', views.admin_appointments_list, name='admin_appointments_list'),
+    path('admin/appointments/export/', views.admin_appointments_export, name='admin_appointments_export'),
     path('admin/appointments/analytics/', views.admin_appointments_analytics, name='admin_appointments_analytics'),
 
     # Admin Lab Reports
+    path('admin/prescriptions/search/', views.admin_prescription_search, name='admin_prescription_search'),
     path('admin/lab-reports/', views.admin_lab_reports_list, name='admin_lab_reports_list'),
+    path('admin/lab-reports/export/', views.admin_lab_reports_export, name='admin_lab_reports_export'),
     path('admin/lab-reports/statistics/', views.admin_lab_reports_statistics, name='admin_lab_reports_statistics'),
 
 
@@ -1,8 +1,20 @@
 import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from datetime import time, datetime, timedelta
 from io import BytesIO
 
 import qrcode
+from django.conf import settings
+
+ERROR_CORRECTION_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
 
 
 def generate_time_slots(start_time, end_time, slot_duration=60):
@@ -19,32 +31,113 @@ def generate_time_slots(start_time, end_time, slot_duration=60):
     return slots
 
 
-def generate_qr_code(data):
-    """Generate QR code and return as base64 encoded string"""
-    try:
-        # Use the main QRCode class correctly
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG')
-        buffer.seek(0)
-
-        # Convert to base64 for embedding in HTML
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        return f"data:image/png;base64,{image_base64}"
-
-    except Exception as e:
-        print(f"QR Code generation error: {e}")
-        # Return a placeholder or None
-        return None
+class QRCodeCache:
+    """PNG bytes keyed by content hash: an in-process LRU within a byte budget, over an optional directory
+
+    The key covers everything that changes the image, so entries never go stale
+    and the disk tier can be shared by every process. The disk tier is never
+    pruned and token QR codes carry patient names, so it is off unless a
+    directory is configured.
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = str(directory) if directory else None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.png')
+
+    def get(self, key):
+        with self.lock:
+            png = self.entries.get(key)
+            if png is not None:
+                self.entries.move_to_end(key)
+                return png
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as png_file:
+                    png = png_file.read()
+            except OSError:
+                return None
+            self._remember(key, png)
+        return png
+
+    def put(self, key, png):
+        self._remember(key, png)
+        if self.directory:
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f'{path}.{os.getpid()}.tmp'
+                with open(temp_path, 'wb') as png_file:
+                    png_file.write(png)
+                os.replace(temp_path, path)
+            except OSError:
+                pass  # the disk tier is only an optimisation
+
+    def _remember(self, key, png):
+        if len(png) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key] = png
+            self.size += len(png)
+            while self.size > self.max_bytes:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_qr_cache = None
+
+
+def get_qr_cache():
+    global _qr_cache
+    if _qr_cache is None:
+        config = getattr(settings, 'QR_CODE_CACHE', {})
+        _qr_cache = QRCodeCache(config.get('MAX_BYTES', 8 * 1024 * 1024), config.get('DIRECTORY'))
+    return _qr_cache
+
+
+def qr_code_key(data, box_size=10, border=4, error_correction='L'):
+    payload = f"{error_correction}:{box_size}:{border}:".encode() + data.encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def render_qr_code_png(data, box_size=10, border=4, error_correction='L'):
+    """Encode a QR code as PNG bytes, uncached (safe to run in worker processes)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def qr_code_png(data, box_size=10, border=4, error_correction='L'):
+    """PNG bytes of a QR code for `data`, built once per distinct payload and parameters"""
+    cache = get_qr_cache()
+    key = qr_code_key(data, box_size, border, error_correction)
+    png = cache.get(key)
+    if png is None:
+        png = render_qr_code_png(data, box_size, border, error_correction)
+        cache.put(key, png)
+    return png
 
 
 def test_qr_generation():
@@ -1,24 +1,36 @@
+import json
+import tempfile
+import time
 from datetime import datetime, timedelta
 from django.utils import timezone
 
-from django.db.models import Q, Count
-from django.http import HttpResponse, JsonResponse
+from django.db.models import Q, Count, F, Sum, Min, Max
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.contrib.auth import login, authenticate, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.paginator import Paginator
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.lib.utils import ImageReader
-import qrcode
-from io import BytesIO
-
-from hospital.models import Doctor, Appointment, Prescription, User, Patient, LabReport
+from hospital.models import Doctor, Appointment, Prescription, User, Patient, LabReport, DailyQueue, DoctorFullyBooked, \
+    WaitlistEntry, DashboardCounter, DailyAppointmentStats, PrescriptionTerm
 from .forms import PatientRegistrationForm, LabReportForm, PatientProfileUpdateForm, DoctorUserForm, DoctorProfileForm, \
     PatientProfileImageForm, PatientPasswordChangeForm
-from .utils import generate_qr_code
+from . import analytics
+from .availability import get_booked_counts, get_doctor_availability
+from .directory import get_doctor_directory
+from .events import get_event_bus, queue_channel
+from .exports import stream_export
+from .idempotency import idempotent, not_final
+from .ratelimit import rate_limited
+from .search import fts_available, lab_report_index, match_expression, patient_index
+from .tokens import open_token_pdf, render_token_batch
+from .waitlist import get_waitlist_status, invalidate_waitlist_positions
+from .utils import qr_code_key, qr_code_png
 
 
 def index(request):
@@ -90,26 +102,70 @@ def dashboard(request):
 
     return redirect('login')
 
+PATIENT_DASHBOARD_PAGE_SIZE = 20
+
+
+def _parse_appointment_cursor(value):
+    """Parse a 'YYYY-MM-DD.token.id' dashboard cursor; None if missing or malformed"""
+    try:
+        date_part, token, appointment_id = value.split('.')
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(token), int(appointment_id)
+    except ValueError:
+        return None
+
+
 @login_required
 def patient_dashboard(request):
     if request.user.user_type != 'patient':
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    # Get patient's appointments
-    appointments = Appointment.objects.filter(patient=request.user).order_by('-appointment_date', 'token_number')
+    patient_appointments = Appointment.objects.filter(patient=request.user)
 
-    # Calculate counts
-    total_appointments = appointments.count()
-    scheduled_appointments = appointments.filter(status='scheduled').count()
-    completed_appointments = appointments.filter(status='completed').count()
+    # All status counts in one conditional aggregate
+    counts = patient_appointments.aggregate(
+        total=Count('id'),
+        scheduled=Count('id', filter=Q(status='scheduled')),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+
+    # Keyset pagination on (date desc, token, id) keeps each page cheap for long histories
+    appointments = patient_appointments.select_related('doctor__user').order_by(
+        '-appointment_date', 'token_number', 'id'
+    )
+    cursor = _parse_appointment_cursor(request.GET.get('after', ''))
+    if cursor:
+        cursor_date, cursor_token, cursor_id = cursor
+        appointments = appointments.filter(
+            Q(appointment_date__lt=cursor_date) |
+            Q(appointment_date=cursor_date, token_number__gt=cursor_token) |
+            Q(appointment_date=cursor_date, token_number=cursor_token, id__gt=cursor_id)
+        )
+    appointments = list(appointments[:PATIENT_DASHBOARD_PAGE_SIZE + 1])
+
+    next_cursor = None
+    if len(appointments) > PATIENT_DASHBOARD_PAGE_SIZE:
+        appointments = appointments[:PATIENT_DASHBOARD_PAGE_SIZE]
+        last = appointments[-1]
+        next_cursor = f"{last.appointment_date.isoformat()}.{last.token_number}.{last.id}"
+
+    # Waitlist entries still waiting for a slot
+    waitlist_entries = WaitlistEntry.objects.filter(
+        patient=request.user,
+        status='waiting'
+    ).select_related('doctor__user')
+    for entry in waitlist_entries:
+        entry.position = get_waitlist_status(entry)['position']
 
     context = {
         'appointments': appointments,
+        'waitlist_entries': waitlist_entries,
         'today': timezone.now().date(),
-        'total_appointments': total_appointments,
-        'scheduled_appointments': scheduled_appointments,
-        'completed_appointments': completed_appointments,
+        'total_appointments': counts['total'],
+        'scheduled_appointments': counts['scheduled'],
+        'completed_appointments': counts['completed'],
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
     }
 
     return render(request, 'patient_dash.html', context)
@@ -148,13 +204,13 @@ def doctor_dashboard(request):
     # Calculate statistics
     today = timezone.now().date()
 
-    today_appointments = Appointment.objects.filter(
+    today_counts = dict(DailyAppointmentStats.objects.filter(
         doctor=doctor,
         appointment_date=today
-    )
+    ).values_list('status', 'count'))
 
-    today_appointments_count = today_appointments.filter(status='scheduled').count()
-    completed_today_count = today_appointments.filter(status='completed').count()
+    today_appointments_count = today_counts.get('scheduled', 0)
+    completed_today_count = today_counts.get('completed', 0)
 
     context = {
         'doctor': doctor,
@@ -165,30 +221,110 @@ def doctor_dashboard(request):
         'completed_today_count': completed_today_count,
         'min_date': timezone.now().date() - timedelta(days=30),
         'max_date': timezone.now().date() + timedelta(days=30),
+        'queue_event_id': get_event_bus().latest_id(queue_channel(doctor.id, selected_date)),
     }
     return render(request, 'doctor_dash.html', context)
 
 
+# Each open stream holds a worker thread under WSGI, so streams are kept short and
+# the browser's EventSource reconnects (resuming from Last-Event-ID) when one ends
+QUEUE_STREAM_DURATION = 25
+QUEUE_STREAM_HEARTBEAT = 15
+
+
+def _queue_event_stream(request, doctor, selected_date, last_id):
+    """Server-Sent Events for a doctor's day; each event carries the re-rendered table rows"""
+    bus = get_event_bus()
+    channel = queue_channel(doctor.id, selected_date)
+    today = timezone.now().date()
+
+    # Close after a while; EventSource reconnects with Last-Event-ID and nothing is lost
+    yield 'retry: 3000\n\n'
+    deadline = time.monotonic() + QUEUE_STREAM_DURATION
+    while time.monotonic() < deadline:
+        events = bus.wait(channel, last_id, min(QUEUE_STREAM_HEARTBEAT, deadline - time.monotonic()))
+        if not events:
+            yield ': keep-alive\n\n'
+            continue
+
+        for event_id, event in events:
+            last_id = event_id
+            appointments = Appointment.objects.filter(
+                id__in=event['appointments'],
+                doctor=doctor
+            ).select_related('patient', 'patient__patient', 'doctor').prefetch_related('prescription')
+            rows = [
+                {
+                    'id': appointment.id,
+                    'token': appointment.token_number,
+                    'html': render_to_string('partials/doctor_queue_row.html', {
+                        'appointment': appointment,
+                        'selected_date': selected_date,
+                        'today': today,
+                    }, request=request),
+                }
+                for appointment in appointments
+            ]
+            found = {row['id'] for row in rows}
+            payload = {
+                'type': event['type'],
+                'rows': rows,
+                'removed': [appointment_id for appointment_id in event['appointments'] if appointment_id not in found],
+            }
+            yield f"id: {event_id}\nevent: queue\ndata: {json.dumps(payload)}\n\n"
+
+
+@login_required
+def doctor_queue_stream(request):
+    """Live queue updates for the doctor dashboard instead of full page reloads"""
+    if request.user.user_type != 'doctor':
+        return HttpResponse('Access denied.', status=403)
+
+    try:
+        doctor = request.user.doctor
+    except Doctor.DoesNotExist:
+        return HttpResponse('Doctor profile not found.', status=404)
+
+    try:
+        selected_date = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        selected_date = timezone.now().date()
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_id = int(last_event_id)
+    except (TypeError, ValueError):
+        last_id = get_event_bus().latest_id(queue_channel(doctor.id, selected_date))
+
+    response = StreamingHttpResponse(
+        _queue_event_stream(request, doctor, selected_date, last_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def admin_dashboard(request):
     if request.user.user_type != 'admin':
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    # Calculate statistics
-    total_doctors = Doctor.objects.count()
-    total_patients = Patient.objects.count()
-    total_users = User.objects.count()
-
-    # Appointment statistics
+    # Statistics come from the signal-maintained counters in one query
     today = timezone.now().date()
-    today_appointments = Appointment.objects.filter(appointment_date=today)
-    total_appointments_today = today_appointments.count()
-    completed_today = today_appointments.filter(status='completed').count()
-
-    # Lab reports statistics
-    total_lab_reports = LabReport.objects.count()
-    recent_lab_reports = LabReport.objects.filter(uploaded_at__date=today).count()
+    names = {
+        'total_doctors': 'doctors',
+        'total_patients': 'patients',
+        'total_users': 'users',
+        'total_appointments_today': DashboardCounter.daily('appointments', today),
+        'completed_today': DashboardCounter.daily('appointments_completed', today),
+        'total_lab_reports': 'lab_reports',
+        'recent_lab_reports': DashboardCounter.daily('lab_reports', today),
+        'active_users_today': DashboardCounter.daily('active_users', today),
+    }
+    values = DashboardCounter.values_for(names.values())
+    stats = {key: values[name] for key, name in names.items()}
 
     # Recent activity
     recent_appointments = Appointment.objects.select_related(
@@ -201,20 +337,12 @@ def admin_dashboard(request):
 
     # System health (placeholder metrics)
     system_health = 100  # Could be calculated based on various factors
-    active_users_today = User.objects.filter(last_login__date=today).count()
 
     context = {
-        'total_doctors': total_doctors,
-        'total_patients': total_patients,
-        'total_users': total_users,
-        'total_appointments_today': total_appointments_today,
-        'completed_today': completed_today,
-        'total_lab_reports': total_lab_reports,
-        'recent_lab_reports': recent_lab_reports,
+        **stats,
         'recent_appointments': recent_appointments,
         'recent_lab_reports_list': recent_lab_reports_list,
         'system_health': system_health,
-        'active_users_today': active_users_today,
         'today': today,
     }
 
@@ -222,39 +350,58 @@ def admin_dashboard(request):
 
 
 def view_doctors(request):
-    doctors = Doctor.objects.all().select_related('user')
+    directory = get_doctor_directory()
 
     # Get filter parameters
     specialization = request.GET.get('specialization', '')
     search_query = request.GET.get('search', '')
+    available_on = request.GET.get('available_on', '')
 
-    # Apply filters
-    if specialization:
-        doctors = doctors.filter(specialization=specialization)
+    weekday = None
+    if available_on:
+        try:
+            weekday = datetime.strptime(available_on, '%Y-%m-%d').weekday()
+        except ValueError:
+            available_on = ''
 
-    if search_query:
-        doctors = doctors.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(specialization__icontains=search_query)
-        )
+    doctors = directory.search(search_query, specialization, weekday)
 
-    # FIX: Always order by specialization for proper grouping
-    doctors = doctors.order_by('specialization')
+    # Today's occupancy comes from the cached per-day booking counts (DailyQueue rows)
+    # (kept per request: the Doctor objects are shared by every request in the process)
+    booked_today = get_booked_counts()
+    entries = [(doctor, doctor.max_appointments - booked_today.get(doctor.pk, 0)) for doctor in doctors]
 
     # Get specializations for filter dropdown
     specializations = Doctor.SPECIALIZATION_CHOICES
 
     context = {
         'doctors': doctors,
+        'specialization_groups': directory.grouped(entries),
         'specializations': specializations,
         'selected_specialization': specialization,
         'search_query': search_query,
+        'available_on': available_on,
     }
     return render(request, 'doctors.html', context)
 
 
+def doctor_suggestions(request):
+    """Type-ahead JSON for the doctor search box, served from the in-memory directory"""
+    results = get_doctor_directory().suggest(request.GET.get('q', ''))
+    for result in results:
+        result['url'] = reverse('make_appointment', args=[result['id']])
+    response = JsonResponse({'results': results})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
 @login_required
+@idempotent
+@rate_limited('booking', {
+    'user': lambda request, **kwargs: request.user.pk,
+    'doctor': lambda request, doctor_id, **kwargs: doctor_id,
+    'global': lambda request, **kwargs: 'all',
+})
 def make_appointment(request, doctor_id):
     doctor = get_object_or_404(Doctor, id=doctor_id)
 
@@ -265,30 +412,27 @@ def make_appointment(request, doctor_id):
         # Basic validation
         if not appointment_date:
             messages.error(request, 'Please select a date.')
-            return redirect('make_appointment', doctor_id=doctor_id)
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
 
         # Convert string to date object
         try:
             appointment_date_obj = datetime.strptime(appointment_date, '%Y-%m-%d').date()
         except ValueError:
             messages.error(request, 'Invalid date format.')
-            return redirect('make_appointment', doctor_id=doctor_id)
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
 
         today = timezone.now().date()
 
         # Check if the selected date is valid (not in past)
         if appointment_date_obj < today:
             messages.error(request, 'Cannot book appointments in the past.')
-            return redirect('make_appointment', doctor_id=doctor_id)
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
 
         # Check if doctor is available on that day
-        day_name = appointment_date_obj.strftime('%A').lower()
-        available_days = [day.strip().lower() for day in doctor.available_days.split(',')]
-
-        if day_name not in available_days:
+        if not doctor.works_on(appointment_date_obj):
             messages.error(request,
                            f'Doctor is not available on {appointment_date_obj.strftime("%A")}. Available days: {doctor.available_days.title()}')
-            return redirect('make_appointment', doctor_id=doctor_id)
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
 
         # Check if patient already has an appointment with this doctor on same date
         existing_appointment = Appointment.objects.filter(
@@ -300,9 +444,9 @@ def make_appointment(request, doctor_id):
 
         if existing_appointment:
             messages.error(request, 'You already have an appointment with this doctor on the selected date.')
-            return redirect('make_appointment', doctor_id=doctor_id)
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
 
-        # Create appointment
+        # Create appointment (the daily capacity check happens atomically with token allocation)
         try:
             appointment = Appointment.objects.create(
                 patient=request.user,
@@ -315,40 +459,115 @@ def make_appointment(request, doctor_id):
                              f'Appointment booked successfully! Your token number is {appointment.token_number}')
             return redirect('appointment_success', appointment_id=appointment.id)
 
+        except DoctorFullyBooked:
+            messages.error(request,
+                           f'Dr. {doctor.user.get_full_name()} is fully booked on '
+                           f'{appointment_date_obj.strftime("%B %d, %Y")}. '
+                           f'Please choose another date or join the waitlist.')
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
+
         except Exception as e:
             messages.error(request, f'Error booking appointment. Please try again.')
             print(f"Appointment creation error: {e}")  # For debugging
-            return redirect('make_appointment', doctor_id=doctor_id)
+            return not_final(redirect('make_appointment', doctor_id=doctor_id))
 
     # GET request - show booking form
     today = timezone.now().date()
 
-    # Calculate today's appointments for this doctor
-    today_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        appointment_date=today,
-        status='scheduled'
-    )
-
-    last_token = today_appointments.last().token_number if today_appointments.exists() else 0
+    # Today's counts for this doctor come from a single DailyQueue row
+    today_queue = DailyQueue.for_day(doctor, today)
 
     context = {
         'doctor': doctor,
         'today': today,
         'max_date': today + timedelta(days=30),
-        'today_appointments_count': today_appointments.count(),
-        'last_token_today': last_token,
+        'today_appointments_count': today_queue.scheduled_count,
+        'last_token_today': today_queue.last_token,
+        'remaining_today': today_queue.remaining_for(doctor),
     }
     return render(request, 'appointment.html', context)
 
 
 @login_required
-def appointment_success(request, appointment_id):
-    """Show appointment confirmation page"""
-    appointment = get_object_or_404(Appointment, id=appointment_id, patient=request.user)
+@idempotent
+def join_waitlist(request, doctor_id):
+    """Queue the patient for a fully booked day instead of retrying the booking"""
+    doctor = get_object_or_404(Doctor, id=doctor_id)
+
+    if request.method != 'POST' or request.user.user_type != 'patient':
+        return redirect('make_appointment', doctor_id=doctor_id)
+
+    try:
+        appointment_date = datetime.strptime(request.POST.get('appointment_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        messages.error(request, 'Invalid date format.')
+        return not_final(redirect('make_appointment', doctor_id=doctor_id))
+
+    if appointment_date < timezone.now().date() or not doctor.works_on(appointment_date):
+        messages.error(request, 'Doctor is not available on the selected date.')
+        return not_final(redirect('make_appointment', doctor_id=doctor_id))
+
+    if Appointment.objects.filter(patient=request.user, doctor=doctor, appointment_date=appointment_date,
+                                  status='scheduled').exists():
+        messages.error(request, 'You already have an appointment with this doctor on the selected date.')
+        return not_final(redirect('make_appointment', doctor_id=doctor_id))
+
+    if DailyQueue.for_day(doctor, appointment_date).remaining_for(doctor) > 0:
+        messages.info(request, f'Dr. {doctor.user.get_full_name()} still has slots on '
+                               f'{appointment_date.strftime("%B %d, %Y")}. Please book one directly.')
+        return not_final(redirect('make_appointment', doctor_id=doctor_id))
+
+    entry, created = WaitlistEntry.objects.get_or_create(
+        patient=request.user,
+        doctor=doctor,
+        appointment_date=appointment_date,
+        status='waiting',
+        defaults={'reason': request.POST.get('reason', '')}
+    )
+    if created:
+        invalidate_waitlist_positions(doctor.id, appointment_date)
+
+    position = get_waitlist_status(entry)['position']
+    messages.success(request, f'You are #{position} on the waitlist for Dr. {doctor.user.get_full_name()} on '
+                              f'{appointment_date.strftime("%B %d, %Y")}. We will book you when a slot frees up.')
+    return redirect('patient_dashboard')
+
 
-    # Generate QR code data for this page
-    qr_data = f"""
+@login_required
+def waitlist_status(request, entry_id):
+    """Cheap polling endpoint for a patient's waitlist position"""
+    entry = get_object_or_404(WaitlistEntry, id=entry_id, patient=request.user)
+    return JsonResponse(get_waitlist_status(entry))
+
+
+@login_required
+@idempotent
+def leave_waitlist(request, entry_id):
+    """Remove the patient from a waitlist"""
+    entry = get_object_or_404(WaitlistEntry, id=entry_id, patient=request.user)
+
+    if request.method == 'POST' and entry.status == 'waiting':
+        entry.status = 'left'
+        entry.save(update_fields=['status'])
+        invalidate_waitlist_positions(entry.doctor_id, entry.appointment_date)
+        messages.success(request, 'You have left the waitlist.')
+
+    return redirect('patient_dashboard')
+
+
+@login_required
+def doctor_availability(request, doctor_id):
+    """JSON calendar of bookable days for the booking page"""
+    doctor = get_object_or_404(Doctor, id=doctor_id)
+    return JsonResponse(get_doctor_availability(doctor))
+
+
+QR_CODE_MAX_AGE = 5 * 60
+
+
+def _appointment_qr_data(appointment):
+    """Text encoded in the confirmation page's QR code"""
+    return f"""
     Hospital Management System
     Appointment Token: #{appointment.token_number}
     Patient: {appointment.patient.get_full_name()}
@@ -358,139 +577,116 @@ def appointment_success(request, appointment_id):
     Specialization: {appointment.doctor.get_specialization_display()}
         """.strip()
 
-    qr_code_base64 = generate_qr_code(qr_data)
 
+@login_required
+def appointment_success(request, appointment_id):
+    """Show appointment confirmation page"""
+    appointment = get_object_or_404(Appointment, id=appointment_id, patient=request.user)
+
+    # The QR image is fetched separately so browsers can cache it (see appointment_qr_code)
     context = {
         'appointment': appointment,
-        'qr_code_base64': qr_code_base64,
+        'qr_code_url': reverse('appointment_qr_code', args=[appointment.id]),
     }
     return render(request, 'appointment_success.html', context)
 
 
+@login_required
+def appointment_qr_code(request, appointment_id):
+    """The appointment's QR code as PNG, revalidated with an ETag of the encoded text"""
+    appointment = get_object_or_404(
+        Appointment.objects.select_related('patient', 'doctor__user'), id=appointment_id, patient=request.user
+    )
+    qr_data = _appointment_qr_data(appointment)
+    etag = f'"{qr_code_key(qr_data)}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(qr_code_png(qr_data), content_type='image/png')
+    response['ETag'] = etag
+    # Private: the image carries the patient's name
+    patch_cache_control(response, private=True, max_age=QR_CODE_MAX_AGE)
+    return response
+
+
 @login_required
 def download_appointment_token(request, appointment_id):
-    """Generate and download appointment token as PDF"""
-    appointment = get_object_or_404(Appointment, id=appointment_id, patient=request.user)
+    """Download the appointment token PDF (rendered once per token content, see hospital/tokens.py)"""
+    appointment = get_object_or_404(
+        Appointment.objects.select_related('patient', 'doctor__user'), id=appointment_id, patient=request.user
+    )
+    return FileResponse(
+        open_token_pdf(appointment),
+        as_attachment=True,
+        filename=f"appointment_token_{appointment.id}.pdf",
+        content_type='application/pdf',
+    )
 
-    # Create PDF response
-    response = HttpResponse(content_type='application/pdf')
-    filename = f"appointment_token_{appointment.id}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    # Create PDF
-    p = canvas.Canvas(response, pagesize=A4)
-    width, height = A4
-
-    # Hospital Header
-    p.setFont("Helvetica-Bold", 20)
-    p.drawString(50, height - 50, "Hospital Management System")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, height - 70, "Quality Healthcare, Always Available")
-
-    # Separator line
-    p.line(50, height - 80, width - 50, height - 80)
-
-    # Title
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(50, height - 110, "APPOINTMENT TOKEN")
-
-    # Token Number (Big and prominent)
-    p.setFont("Helvetica-Bold", 48)
-    p.drawString(50, height - 170, f"TOKEN #{appointment.token_number}")
-
-    # Appointment Details
-    y_position = height - 220
-    p.setFont("Helvetica-Bold", 12)
-
-    # Patient Details
-    p.drawString(50, y_position, "PATIENT DETAILS:")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, y_position - 20, f"Name: {appointment.patient.get_full_name()}")
-    p.drawString(50, y_position - 35, f"Phone: {appointment.patient.phone}")
-    p.drawString(50, y_position - 50, f"Email: {appointment.patient.email}")
-
-    # Doctor Details
-    y_position -= 80
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, y_position, "DOCTOR DETAILS:")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, y_position - 20, f"Name: Dr. {appointment.doctor.user.get_full_name()}")
-    p.drawString(50, y_position - 35, f"Specialization: {appointment.doctor.get_specialization_display()}")
-    p.drawString(50, y_position - 50, f"Qualification: {appointment.doctor.qualification}")
-
-    # Appointment Timing
-    y_position -= 80
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, y_position, "APPOINTMENT TIMING:")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, y_position - 20, f"Date: {appointment.appointment_date.strftime('%B %d, %Y')}")
-    p.drawString(50, y_position - 35, f"Estimated Time: {appointment.estimated_time.strftime('%I:%M %p')}")
-
-    # Generate QR Code
-    qr_data = f"""
-Hospital Management System
-Appointment Token: #{appointment.token_number}
-Patient: {appointment.patient.get_full_name()}
-Doctor: Dr. {appointment.doctor.user.get_full_name()}
-Date: {appointment.appointment_date.strftime('%Y-%m-%d')}
-Time: {appointment.estimated_time.strftime('%H:%M')}
-    """.strip()
-
-    qr = qrcode.QRCode(version=1, box_size=4, border=2)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = BytesIO()
-    qr_img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-
-    # Add QR Code to PDF (right side)
-    qr_image = ImageReader(img_buffer)
-    p.drawImage(qr_image, width - 120, height - 300, width=80, height=80)
-    p.setFont("Helvetica-Oblique", 10)
-    p.drawString(width - 120, height - 385, "Scan for details")
-
-    # Instructions
-    y_position = 200
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, y_position, "IMPORTANT INSTRUCTIONS:")
-    p.setFont("Helvetica", 10)
-
-    instructions = [
-        "1. Arrive 15 minutes before your estimated appointment time",
-        "2. Bring this token and any relevant medical reports",
-        "3. Inform reception if you need to reschedule or cancel",
-        "4. Emergency cases will be given priority",
-        "5. Maintain silence in the waiting area"
-    ]
-
-    for i, instruction in enumerate(instructions):
-        p.drawString(60, y_position - 20 - (i * 15), instruction)
-
-    # Footer
-    p.setFont("Helvetica-Oblique", 10)
-    p.drawString(50, 50, "Thank you for choosing our hospital. We care for your health!")
-    p.drawString(50, 35, "Generated on: " + datetime.now().strftime("%Y-%m-%d %I:%M %p"))
-
-    p.showPage()
-    p.save()
 
-    return response
+def _day_tokens_response(request, doctor, fallback):
+    """All of a doctor's non-cancelled tokens for ?date= as one multi-page PDF"""
+    day = _parse_filter_date(request.GET.get('date')) or timezone.now().date()
+    appointments = Appointment.objects.filter(
+        doctor=doctor, appointment_date=day
+    ).exclude(status='cancelled').select_related('patient', 'doctor__user').order_by('token_number')
+
+    if not appointments.exists():
+        messages.info(request, f'No tokens to print for {day.strftime("%B %d, %Y")}.')
+        return fallback
+
+    # Spooled to a temporary file, then streamed out in chunks by FileResponse
+    output = tempfile.TemporaryFile()
+    render_token_batch(appointments, output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"tokens_{doctor.id}_{day.isoformat()}.pdf",
+        content_type='application/pdf',
+    )
+
+
+@login_required
+def doctor_day_tokens(request):
+    """Doctor/reception: print every token of the selected day"""
+    if request.user.user_type != 'doctor':
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    try:
+        doctor = request.user.doctor
+    except Doctor.DoesNotExist:
+        messages.error(request, 'Doctor profile not found.')
+        return redirect('dashboard')
+
+    fallback = redirect(f"{reverse('doctor_dashboard')}?date={request.GET.get('date', '')}")
+    return _day_tokens_response(request, doctor, fallback)
 
 
 @login_required
+def admin_doctor_day_tokens(request, doctor_id):
+    """Admin: print every token of a doctor's day"""
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    doctor = get_object_or_404(Doctor, id=doctor_id)
+    return _day_tokens_response(request, doctor, redirect('admin_doctor_detail', doctor_id=doctor.id))
+
+
+@login_required
+@idempotent
 def cancel_appointment(request, appointment_id):
     """Cancel an appointment"""
     appointment = get_object_or_404(Appointment, id=appointment_id, patient=request.user)
 
     if request.method == 'POST':
-        if appointment.cancel():
-            messages.success(request, 'Appointment cancelled successfully!')
-        else:
+        if not appointment.cancel():
             messages.error(request,
                            'Cannot cancel this appointment. It may be too close to the appointment time or already completed/cancelled.')
+            return not_final(redirect('patient_dashboard'))
 
+        messages.success(request, 'Appointment cancelled successfully!')
         return redirect('patient_dashboard')
 
     # If someone tries to access via GET, redirect to dashboard
@@ -498,13 +694,14 @@ def cancel_appointment(request, appointment_id):
 
 
 @login_required
+@idempotent
 def add_prescription(request):
     """Add or edit prescription for an appointment - HANDLES BOTH GET AND POST"""
     print("🟢 add_prescription view called")  # Debug
 
     if request.user.user_type != 'doctor':
         print("Access denied - not a doctor")  # Debug
-        return JsonResponse({'success': False, 'error': 'Access denied'})
+        return not_final(JsonResponse({'success': False, 'error': 'Access denied'}))
 
     if request.method == 'POST':
         print("🟢 POST request received")  # Debug
@@ -519,7 +716,7 @@ def add_prescription(request):
 
             if not appointment_id:
                 print("No appointment ID")  # Debug
-                return JsonResponse({'success': False, 'error': 'Appointment ID required'})
+                return not_final(JsonResponse({'success': False, 'error': 'Appointment ID required'}))
 
             # Get appointment
             try:
@@ -531,20 +728,20 @@ def add_prescription(request):
                 print(f"Found appointment: {appointment}")  # Debug
             except Appointment.DoesNotExist:
                 print("Appointment not found")  # Debug
-                return JsonResponse({'success': False, 'error': 'Appointment not found'})
+                return not_final(JsonResponse({'success': False, 'error': 'Appointment not found'}))
 
             # Additional explicit check
             if appointment.status == 'cancelled':
-                return JsonResponse({'success': False, 'error': 'Cannot prescribe for cancelled appointments'})
+                return not_final(JsonResponse({'success': False, 'error': 'Cannot prescribe for cancelled appointments'}))
 
             # Check if prescription is allowed
             if not appointment.can_prescribe():
                 print("Cannot prescribe for future appointment")  # Debug
-                return JsonResponse({'success': False, 'error': 'Cannot prescribe for future appointments'})
+                return not_final(JsonResponse({'success': False, 'error': 'Cannot prescribe for future appointments'}))
 
             if not prescription_text:
                 print("Empty prescription text")  # Debug
-                return JsonResponse({'success': False, 'error': 'Prescription text is required'})
+                return not_final(JsonResponse({'success': False, 'error': 'Prescription text is required'}))
 
             # Create or update prescription
             try:
@@ -572,12 +769,12 @@ def add_prescription(request):
             print(f"Exception in view: {str(e)}")  # Debug
             import traceback
             traceback.print_exc()  # This will print full traceback to console
-            return JsonResponse({'success': False, 'error': f'Server error: {str(e)}'})
+            return not_final(JsonResponse({'success': False, 'error': f'Server error: {str(e)}'}))
 
     else:
         # GET request - should not happen for this endpoint
         print("GET request to POST-only endpoint")  # Debug
-        return JsonResponse({'success': False, 'error': 'Method not allowed'})
+        return not_final(JsonResponse({'success': False, 'error': 'Method not allowed'}))
 
 
 @login_required
@@ -631,39 +828,82 @@ def get_prescription(request, appointment_id):
         return JsonResponse({'error': 'Server error'}, status=500)
 
 
+PRESCRIPTION_SEARCH_PAGE_SIZE = 25
+
+
+def _prescription_search_page(request, appointments, doctor=None):
+    """Paginated appointments whose prescriptions match ?q=, with patient and prescription joined in"""
+    search_query = request.GET.get('q', '').strip()
+    page_obj = None
+    if search_query:
+        matches = PrescriptionTerm.filter_appointments(appointments, search_query, doctor=doctor).select_related(
+            'patient', 'doctor__user', 'prescription'
+        ).order_by('-appointment_date', '-id')
+        page_obj = Paginator(matches, PRESCRIPTION_SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+    return {'search_query': search_query, 'page_obj': page_obj}
+
+
+@login_required
+def doctor_prescription_search(request):
+    """Doctor searches their own patients' prescriptions (e.g. everyone prescribed a drug)"""
+    if request.user.user_type != 'doctor':
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    doctor = request.user.doctor
+    context = _prescription_search_page(request, Appointment.objects.filter(doctor=doctor), doctor=doctor)
+    context['search_url'] = 'doctor_prescription_search'
+    return render(request, 'prescription_search.html', context)
+
+
 @login_required
+def admin_prescription_search(request):
+    """Admin search across every prescription"""
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    context = _prescription_search_page(request, Appointment.objects.all())
+    context['search_url'] = 'admin_prescription_search'
+    context['show_doctor'] = True
+    return render(request, 'prescription_search.html', context)
+
+
+@login_required
+@idempotent
 def complete_appointment(request, appointment_id):
     """Mark appointment as completed"""
     if request.user.user_type != 'doctor':
         messages.error(request, 'Access denied.')
-        return redirect('doctor_dashboard')
+        return not_final(redirect('doctor_dashboard'))
 
     appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user.doctor)
 
-    if appointment.complete_appointment():
-        messages.success(request, 'Appointment marked as completed.')
-    else:
+    if not appointment.complete_appointment():
         messages.error(request, 'Could not complete appointment.')
+        return not_final(redirect('doctor_dashboard'))
 
+    messages.success(request, 'Appointment marked as completed.')
     return redirect('doctor_dashboard')
 
 
 @login_required
+@idempotent
 def revert_appointment(request, appointment_id):
     """Revert completed appointment back to scheduled"""
     if request.user.user_type != 'doctor':
         messages.error(request, 'Access denied.')
-        return redirect('doctor_dashboard')
+        return not_final(redirect('doctor_dashboard'))
 
     appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user.doctor)
 
-    if appointment.status == 'completed':
-        appointment.status = 'scheduled'
-        appointment.save()
-        messages.success(request, 'Appointment reverted to scheduled status.')
-    else:
+    if appointment.status != 'completed':
         messages.error(request, 'Can only revert completed appointments.')
+        return not_final(redirect('doctor_dashboard'))
 
+    appointment.status = 'scheduled'
+    appointment.save()
+    messages.success(request, 'Appointment reverted to scheduled status.')
     return redirect('doctor_dashboard')
 
 
@@ -818,15 +1058,15 @@ def patient_treatment_history(request):
         first_visit=Min('appointment__appointment_date'),
         has_prescriptions=Exists(prescription_exists)
     ).select_related('user')
+    doctors = list(doctors)
 
-    # Calculate overall statistics
-    appointments = Appointment.objects.filter(patient=request.user)
-    total_consultations = appointments.count()
-    total_doctors = doctors.count()
+    # Overall statistics are folded from the per-doctor rows (no extra queries)
+    total_consultations = sum(doctor.total_consultations for doctor in doctors)
+    total_doctors = len(doctors)
 
-    if appointments.exists():
-        first_visit_overall = appointments.earliest('appointment_date').appointment_date
-        last_visit_overall = appointments.latest('appointment_date').appointment_date
+    if doctors:
+        first_visit_overall = min(doctor.first_visit for doctor in doctors)
+        last_visit_overall = max(doctor.last_visit for doctor in doctors)
     else:
         first_visit_overall = None
         last_visit_overall = None
@@ -1134,16 +1374,18 @@ def admin_doctor_detail(request, doctor_id):
     ).select_related('patient').order_by('-appointment_date')[:10]
 
     # Get doctor's statistics
-    total_appointments = Appointment.objects.filter(doctor=doctor).count()
-    completed_appointments = Appointment.objects.filter(doctor=doctor, status='completed').count()
-    today_appointments = Appointment.objects.filter(doctor=doctor, appointment_date=timezone.now().date()).count()
+    stats = doctor.daily_stats.aggregate(
+        total=Coalesce(Sum('count'), 0),
+        completed=Coalesce(Sum('count', filter=Q(status='completed')), 0),
+        today=Coalesce(Sum('count', filter=Q(appointment_date=timezone.now().date())), 0),
+    )
 
     context = {
         'doctor': doctor,
         'recent_appointments': recent_appointments,
-        'total_appointments': total_appointments,
-        'completed_appointments': completed_appointments,
-        'today_appointments': today_appointments,
+        'total_appointments': stats['total'],
+        'completed_appointments': stats['completed'],
+        'today_appointments': stats['today'],
     }
     return render(request, 'admin_doctor_detail.html', context)
 
@@ -1235,6 +1477,9 @@ def admin_doctor_toggle_active(request, doctor_id):
     return redirect('admin_doctors_list')
 
 
+PATIENT_SEARCH_PAGE_SIZE = 25
+
+
 @login_required
 def admin_patients_list(request):
     """Admin view to list all patients"""
@@ -1248,20 +1493,19 @@ def admin_patients_list(request):
     # Get all patients
     patients = Patient.objects.select_related('user').all()
 
-    # Apply search filter
-    if search_query:
-        patients = patients.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(user__username__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
-            Q(user__phone__icontains=search_query)
-        )
+    # Full-text searches are ranked by relevance and paginated; the total counts every match
+    page_obj = None
+    if search_query and fts_available() and match_expression(search_query):
+        ranked = patient_index.ranked(patients, search_query)
+        page_obj = Paginator(ranked, PATIENT_SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+    elif search_query:
+        patients = patient_index.matching(patients, search_query)
 
     context = {
-        'patients': patients,
+        'patients': page_obj.object_list if page_obj else patients,
+        'page_obj': page_obj,
         'search_query': search_query,
-        'total_patients': patients.count(),
+        'total_patients': page_obj.paginator.count if page_obj else patients.count(),
     }
     return render(request, 'admin_patients_list.html', context)
 
@@ -1322,32 +1566,28 @@ def admin_patient_toggle_active(request, patient_id):
 
 # views.py - Add these views
 
-@login_required
-def admin_appointments_list(request):
-    """Admin view to list and manage all appointments"""
-    if request.user.user_type != 'admin' and not request.user.is_staff:
-        messages.error(request, 'Access denied.')
-        return redirect('dashboard')
+def _parse_filter_date(value):
+    """Date from a YYYY-MM-DD filter value, or None if it is empty or malformed"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
 
-    # Get filter parameters
-    status_filter = request.GET.get('status', '')
-    date_filter = request.GET.get('date', '')
-    doctor_filter = request.GET.get('doctor', '')
-    search_query = request.GET.get('search', '')
 
-    # Get all appointments with related data
-    appointments = Appointment.objects.select_related(
-        'patient', 'doctor', 'doctor__user'
-    ).prefetch_related('prescription').order_by('-appointment_date', '-created_at')
+def _filter_admin_appointments(appointments, params):
+    """Apply the admin appointment list filters (status, date, doctor, search)"""
+    status_filter = params.get('status', '')
+    date_filter = _parse_filter_date(params.get('date', ''))
+    doctor_filter = params.get('doctor', '')
+    search_query = params.get('search', '')
 
-    # Apply filters
     if status_filter:
         appointments = appointments.filter(status=status_filter)
 
     if date_filter:
         appointments = appointments.filter(appointment_date=date_filter)
 
-    if doctor_filter:
+    if doctor_filter.isdigit():
         appointments = appointments.filter(doctor_id=doctor_filter)
 
     if search_query:
@@ -1359,6 +1599,88 @@ def admin_appointments_list(request):
             Q(reason__icontains=search_query)
         )
 
+    return appointments.order_by('-appointment_date', '-created_at')
+
+
+def _filter_admin_lab_reports(lab_reports, params, search=True):
+    """Apply the admin lab report list filters (report type, doctor, date range, search)"""
+    report_type_filter = params.get('report_type', '')
+    doctor_filter = params.get('doctor', '')
+    date_from = _parse_filter_date(params.get('date_from', ''))
+    date_to = _parse_filter_date(params.get('date_to', ''))
+    search_query = params.get('search', '')
+
+    if report_type_filter:
+        lab_reports = lab_reports.filter(report_type=report_type_filter)
+
+    if doctor_filter.isdigit():
+        lab_reports = lab_reports.filter(doctor_id=doctor_filter)
+
+    if date_from:
+        lab_reports = lab_reports.filter(uploaded_at__date__gte=date_from)
+
+    if date_to:
+        lab_reports = lab_reports.filter(uploaded_at__date__lte=date_to)
+
+    if search_query and search:
+        lab_reports = lab_report_index.matching(lab_reports, search_query)
+
+    return lab_reports.order_by('-uploaded_at')
+
+
+APPOINTMENT_EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('appointment_date', 'Date'),
+    ('token_number', 'Token'),
+    ('estimated_time', 'Estimated Time'),
+    ('status', 'Status'),
+    ('patient__username', 'Patient Username'),
+    ('patient__first_name', 'Patient First Name'),
+    ('patient__last_name', 'Patient Last Name'),
+    ('doctor__user__first_name', 'Doctor First Name'),
+    ('doctor__user__last_name', 'Doctor Last Name'),
+    ('doctor__specialization', 'Specialization'),
+    ('reason', 'Reason'),
+    ('created_at', 'Booked At'),
+]
+
+LAB_REPORT_EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('uploaded_at', 'Uploaded At'),
+    ('report_type', 'Report Type'),
+    ('test_name', 'Test Name'),
+    ('appointment_id', 'Appointment ID'),
+    ('appointment__patient__first_name', 'Patient First Name'),
+    ('appointment__patient__last_name', 'Patient Last Name'),
+    ('doctor__user__first_name', 'Doctor First Name'),
+    ('doctor__user__last_name', 'Doctor Last Name'),
+    ('findings', 'Findings'),
+    ('notes', 'Notes'),
+    ('report_file', 'File'),
+]
+
+
+@login_required
+def admin_appointments_list(request):
+    """Admin view to list and manage all appointments"""
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    # Get filter parameters
+    status_filter = request.GET.get('status', '')
+    date_filter = request.GET.get('date', '')
+    doctor_filter = request.GET.get('doctor', '')
+    search_query = request.GET.get('search', '')
+
+    # Get all appointments with related data
+    appointments = _filter_admin_appointments(
+        Appointment.objects.select_related(
+            'patient', 'doctor', 'doctor__user'
+        ).prefetch_related('prescription'),
+        request.GET
+    )
+
     # Get doctors for filter dropdown
     doctors = Doctor.objects.select_related('user').all()
 
@@ -1385,103 +1707,58 @@ def admin_appointments_list(request):
 
 
 @login_required
-def admin_appointments_analytics(request):
-    """Admin view for appointment analytics and insights"""
+def admin_appointments_export(request):
+    """Stream the filtered appointment list as CSV (default) or NDJSON (?format=ndjson)"""
     if request.user.user_type != 'admin' and not request.user.is_staff:
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    # Date range for analytics (last 30 days)
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=30)
+    appointments = _filter_admin_appointments(Appointment.objects.all(), request.GET)
+    filename = f"appointments-{timezone.now():%Y%m%d-%H%M%S}"
+    return stream_export(appointments, APPOINTMENT_EXPORT_COLUMNS, filename, request.GET.get('format', 'csv'))
 
-    # Get appointments in date range
-    appointments = Appointment.objects.filter(
-        appointment_date__range=[start_date, end_date]
-    ).select_related('doctor', 'doctor__user')
 
-    # Daily appointments count
-    daily_counts = appointments.values('appointment_date').annotate(
-        total=Count('id'),
-        completed=Count('id', filter=Q(status='completed')),
-        scheduled=Count('id', filter=Q(status='scheduled')),
-        cancelled=Count('id', filter=Q(status='cancelled'))
-    ).order_by('appointment_date')
-
-    # Doctor-wise statistics
-    doctor_stats = appointments.values(
-        'doctor__user__first_name',
-        'doctor__user__last_name',
-        'doctor__specialization'
-    ).annotate(
-        total=Count('id'),
-        completed=Count('id', filter=Q(status='completed')),
-    ).order_by('-total')
-
-    # Calculate completion rate for each doctor
-    for stat in doctor_stats:
-        stat['completion_rate'] = (stat['completed'] * 100.0 / stat['total']) if stat['total'] > 0 else 0
-
-    # Status distribution
-    status_distribution = appointments.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
-
-    # Weekly trends - SQLite compatible
-    weekly_trends = []
-    current_date = start_date
-    while current_date <= end_date:
-        week_start = current_date
-        week_end = current_date + timedelta(days=6)
-        if week_end > end_date:
-            week_end = end_date
-
-        week_appointments = appointments.filter(
-            appointment_date__range=[week_start, week_end]
-        ).count()
-
-        weekly_trends.append({
-            'week': f"{week_start.strftime('%m/%d')}-{week_end.strftime('%m/%d')}",
-            'total': week_appointments
-        })
-
-        current_date = week_end + timedelta(days=1)
-
-    # Peak hours analysis - SQLite compatible
-    peak_hours = []
-    for hour in range(8, 18):  # From 8 AM to 5 PM
-        hour_appointments = appointments.filter(
-            estimated_time__hour=hour
-        ).count()
-
-        if hour_appointments > 0:
-            peak_hours.append({
-                'estimated_time__hour': hour,
-                'count': hour_appointments
-            })
+def _analytics_date_range(request, default_days=30):
+    """Read ?start=/&end= (YYYY-MM-DD); defaults to the last `default_days` days"""
+    end_date = timezone.now().date()
+    start_date = end_date - timedelta(days=default_days)
+    try:
+        if request.GET.get('end'):
+            end_date = datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+        if request.GET.get('start'):
+            start_date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+        else:
+            start_date = end_date - timedelta(days=default_days)
+    except ValueError:
+        messages.error(request, f'Invalid date range, showing the last {default_days} days.')
+        end_date = timezone.now().date()
+        start_date = end_date - timedelta(days=default_days)
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    return start_date, end_date
 
-    # Sort by count descending
-    peak_hours.sort(key=lambda x: x['count'], reverse=True)
 
-    total_appointments_count = appointments.count()
-    completed_appointments_count = appointments.filter(status='completed').count()
-    completion_rate = (
-                completed_appointments_count * 100.0 / total_appointments_count) if total_appointments_count > 0 else 0
+@login_required
+def admin_appointments_analytics(request):
+    """Admin view for appointment analytics and insights"""
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    # Date range for analytics (last 30 days unless ?start=/&end= are given)
+    start_date, end_date = _analytics_date_range(request)
 
     context = {
         'start_date': start_date,
         'end_date': end_date,
-        'daily_counts': list(daily_counts),
-        'doctor_stats': doctor_stats,
-        'status_distribution': list(status_distribution),
-        'weekly_trends': weekly_trends,
-        'peak_hours': peak_hours,
-        'total_appointments': total_appointments_count,
-        'completion_rate': completion_rate,
+        **analytics.appointment_analytics(start_date, end_date),
     }
     return render(request, 'admin_appointments_analytics.html', context)
 
 
+LAB_REPORT_SEARCH_PAGE_SIZE = 25
+
+
 @login_required
 def admin_lab_reports_list(request):
     """Admin view to list and manage all lab reports"""
@@ -1497,46 +1774,35 @@ def admin_lab_reports_list(request):
     search_query = request.GET.get('search', '')
 
     # Get all lab reports with related data
-    lab_reports = LabReport.objects.select_related(
+    all_reports = LabReport.objects.select_related(
         'appointment',
         'appointment__patient',
         'doctor',
         'doctor__user'
-    ).order_by('-uploaded_at')
-
-    # Apply filters
-    if report_type_filter:
-        lab_reports = lab_reports.filter(report_type=report_type_filter)
-
-    if doctor_filter:
-        lab_reports = lab_reports.filter(doctor_id=doctor_filter)
-
-    if date_from:
-        lab_reports = lab_reports.filter(uploaded_at__date__gte=date_from)
-
-    if date_to:
-        lab_reports = lab_reports.filter(uploaded_at__date__lte=date_to)
+    )
+    lab_reports = _filter_admin_lab_reports(all_reports, request.GET)
 
-    if search_query:
-        lab_reports = lab_reports.filter(
-            Q(test_name__icontains=search_query) |
-            Q(appointment__patient__first_name__icontains=search_query) |
-            Q(appointment__patient__last_name__icontains=search_query) |
-            Q(doctor__user__first_name__icontains=search_query) |
-            Q(doctor__user__last_name__icontains=search_query) |
-            Q(findings__icontains=search_query)
-        )
+    # Full-text searches are ranked by relevance, paginated and show the matching passage
+    page_obj = None
+    if search_query and fts_available():
+        ranked = lab_report_index.ranked(_filter_admin_lab_reports(all_reports, request.GET, search=False), search_query)
+        page_obj = Paginator(ranked, LAB_REPORT_SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
 
     # Get doctors and report types for filter dropdowns
     doctors = Doctor.objects.select_related('user').all()
     report_types = LabReport.REPORT_TYPES
 
     # Calculate statistics
-    total_reports = lab_reports.count()
+    total_reports = page_obj.paginator.count if page_obj else lab_reports.count()
     today_reports = lab_reports.filter(uploaded_at__date=timezone.now().date()).count()
 
+    params = request.GET.copy()
+    params.pop('page', None)
+
     context = {
-        'lab_reports': lab_reports,
+        'lab_reports': page_obj.object_list if page_obj else lab_reports,
+        'page_obj': page_obj,
+        'page_query': params.urlencode(),
         'doctors': doctors,
         'report_types': report_types,
         'report_type_filter': report_type_filter,
@@ -1551,93 +1817,35 @@ def admin_lab_reports_list(request):
 
 
 @login_required
-def admin_lab_reports_statistics(request):
-    """Admin view for lab reports statistics and insights"""
+def admin_lab_reports_export(request):
+    """Stream the filtered lab report list as CSV (default) or NDJSON (?format=ndjson)"""
     if request.user.user_type != 'admin' and not request.user.is_staff:
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    # Date range for statistics (last 30 days)
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=30)
-
-    # Get lab reports in date range
-    lab_reports = LabReport.objects.filter(
-        uploaded_at__date__range=[start_date, end_date]
-    ).select_related('doctor', 'doctor__user', 'appointment', 'appointment__patient')
-
-    # Report type distribution
-    type_distribution = lab_reports.values('report_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
-
-    # Daily upload counts - SQLite compatible
-    daily_uploads = []
-    current_date = start_date
-    while current_date <= end_date:
-        day_count = lab_reports.filter(uploaded_at__date=current_date).count()
-        if day_count > 0:
-            daily_uploads.append({
-                'upload_date': current_date,
-                'count': day_count
-            })
-        current_date += timedelta(days=1)
-
-    # Doctor-wise statistics
-    doctor_stats = lab_reports.values(
-        'doctor__user__first_name',
-        'doctor__user__last_name',
-        'doctor__specialization'
-    ).annotate(
-        total_reports=Count('id'),
-        unique_patients=Count('appointment__patient', distinct=True)
-    ).order_by('-total_reports')
-
-    # Monthly trend - SQLite compatible
-    monthly_trend = []
-    current_month = start_date.replace(day=1)
-    while current_month <= end_date:
-        # Calculate end of month
-        if current_month.month == 12:
-            next_month = current_month.replace(year=current_month.year + 1, month=1, day=1)
-        else:
-            next_month = current_month.replace(month=current_month.month + 1, day=1)
+    lab_reports = _filter_admin_lab_reports(LabReport.objects.all(), request.GET)
+    filename = f"lab-reports-{timezone.now():%Y%m%d-%H%M%S}"
+    return stream_export(lab_reports, LAB_REPORT_EXPORT_COLUMNS, filename, request.GET.get('format', 'csv'))
 
-        month_end = next_month - timedelta(days=1)
-        if month_end > end_date:
-            month_end = end_date
 
-        month_count = lab_reports.filter(
-            uploaded_at__date__range=[current_month, month_end]
-        ).count()
-
-        monthly_trend.append({
-            'year': current_month.year,
-            'month': current_month.month,
-            'count': month_count
-        })
-
-        current_month = next_month
+@login_required
+def admin_lab_reports_statistics(request):
+    """Admin view for lab reports statistics and insights"""
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
 
-    # Most common tests
-    common_tests = lab_reports.values('test_name').annotate(
-        count=Count('id')
-    ).order_by('-count')[:10]
+    # Date range for statistics (last 30 days unless ?start=/&end= are given)
+    start_date, end_date = _analytics_date_range(request)
 
-    total_reports_count = lab_reports.count()
-    unique_patients_count = lab_reports.values('appointment__patient').distinct().count()
-    unique_doctors_count = lab_reports.values('doctor').distinct().count()
+    # Bucketed counts come from one grouped query each and are cached per range
+    stats = analytics.lab_report_statistics(start_date, end_date)
 
     context = {
         'start_date': start_date,
         'end_date': end_date,
-        'type_distribution': list(type_distribution),
-        'daily_uploads': daily_uploads,
-        'doctor_stats': doctor_stats,
-        'monthly_trend': monthly_trend,
-        'common_tests': list(common_tests),
-        'total_reports': total_reports_count,
-        'unique_patients': unique_patients_count,
-        'unique_doctors': unique_doctors_count,
+        **stats,
     }
+    if request.GET.get('compare') == 'yoy':
+        context['year_over_year'] = analytics.lab_report_year_over_year(start_date, end_date, stats)
     return render(request, 'admin_lab_reports_statistics.html', context)
\ No newline at end of file
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+
+from hospital.models import WaitlistEntry
+
+WAITLIST_CACHE_TIMEOUT = 60 * 60
+
+
+def _version_key(doctor_id, appointment_date):
+    return f"waitlist_version:{doctor_id}:{appointment_date.isoformat()}"
+
+
+def _version(doctor_id, appointment_date):
+    key = _version_key(doctor_id, appointment_date)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def invalidate_waitlist_positions(doctor_id, appointment_date):
+    """Bump the day's version so every cached position for it goes stale at once"""
+    key = _version_key(doctor_id, appointment_date)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_waitlist_status(entry):
+    """Status, position and promoted appointment for an entry, cached per waitlist version"""
+    key = f"waitlist_status:{entry.id}:{_version(entry.doctor_id, entry.appointment_date)}"
+    status = cache.get(key)
+    if status is None:
+        entry.refresh_from_db(fields=['status', 'appointment'])
+        status = {
+            'id': entry.id,
+            'status': entry.status,
+            'position': None,
+            'appointment_id': entry.appointment_id,
+            'token_number': None,
+        }
+        if entry.status == 'waiting':
+            status['position'] = WaitlistEntry.objects.filter(
+                doctor_id=entry.doctor_id,
+                appointment_date=entry.appointment_date,
+                status='waiting',
+                id__lt=entry.id
+            ).count() + 1
+        elif entry.appointment_id:
+            status['token_number'] = entry.appointment.token_number
+        cache.set(key, status, WAITLIST_CACHE_TIMEOUT)
+    return status